@@ -0,0 +1,79 @@
+"""Throughput and tail latency of the read endpoints under WSGI and ASGI
+
+Fires concurrent GET requests at one or more running deployments and prints
+requests/s with p50/p99 latency for each. Start the servers first, against
+the same database, e.g.:
+
+    gunicorn blogAPI.wsgi -w 4 -b :8000
+    uvicorn blogAPI.asgi:application --workers 4 --port 8001
+
+then compare the DRF views under WSGI with the native async ones under ASGI:
+
+    python benchmarks/bench_asgi.py \\
+        --target wsgi=http://localhost:8000/api/v1/ \\
+        --target asgi=http://localhost:8001/api/v1/async/
+
+Usage: python benchmarks/bench_asgi.py --target NAME=BASE_URL [--target ...]
+       [--path posts/] [--concurrency 64] [--requests 2000] [--warmup 100]
+Only needs the standard library; nothing is imported from the project.
+"""
+import argparse
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_PATHS = ['posts/', 'posts/?cursor=', 'categories/', 'tags/']
+
+
+def fetch(url):
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            ok = response.status == 200
+    except OSError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+def run(urls, concurrency, requests):
+    """ Spread ``requests`` GETs over ``urls``, ``concurrency`` at a time """
+    schedule = [urls[i % len(urls)] for i in range(requests)]
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(fetch, schedule))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        'rps': requests / elapsed,
+        'p50': statistics.median(latencies) * 1000,
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target', action='append', required=True, metavar='NAME=BASE_URL')
+    parser.add_argument('--path', action='append', help=f'endpoint relative to the base URL (default: {DEFAULT_PATHS})')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100)
+    args = parser.parse_args()
+
+    paths = args.path or DEFAULT_PATHS
+    print(f'concurrency: {args.concurrency}, requests: {args.requests}, paths: {", ".join(paths)}')
+    print(f'{"target":<12} {"req/s":>10} {"p50 ms":>10} {"p99 ms":>10} {"errors":>8}')
+    for target in args.target:
+        name, _, base = target.partition('=')
+        urls = [base.rstrip('/') + '/' + path for path in paths]
+        run(urls, args.concurrency, args.warmup)
+        result = run(urls, args.concurrency, args.requests)
+        print(f'{name:<12} {result["rps"]:>10.1f} {result["p50"]:>10.1f} {result["p99"]:>10.1f} {result["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""JSON rendering throughput and bytes on the wire of post list pages
+
+Renders pages of posts shaped like the ``/api/v1/posts/`` response with
+DRF's stdlib ``JSONRenderer`` and with ``core.renderers.FastJSONRenderer``
+(orjson), parses them back with both parsers, and reports the body size
+with and without the gzip compression applied by ``CompressionMiddleware``.
+
+Usage: python benchmarks/bench_rendering.py [--posts 100] [--repeat 200]
+Uses the project settings (SECRET_KEY must be set as for the app). No
+database is needed.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blogAPI.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils.text import compress_string  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from blog.management.commands.seed_blog import WORDS  # noqa: E402
+from core import renderers  # noqa: E402
+
+
+def make_page(count, rng):
+    now = datetime.now(timezone.utc)
+    results = []
+    for i in range(count):
+        created_at = (now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))).isoformat()
+        results.append({
+            'id': i + 1,
+            'title': ' '.join(rng.choices(WORDS, k=rng.randint(4, 10))).capitalize(),
+            'content': ' '.join(rng.choices(WORDS, k=rng.randint(40, 200))),
+            'author': rng.randint(1, 1000),
+            'categories': rng.sample(range(1, 21), rng.randint(1, 3)),
+            'tags': rng.sample(range(1, 201), rng.randint(1, 5)),
+            'comment_count': rng.randint(0, 50),
+            'created_at': created_at,
+            'updated_at': created_at,
+        })
+    return {'count': 100000, 'next': 'http://localhost/api/v1/posts/?limit=100&offset=100',
+            'previous': None, 'results': results}
+
+
+def best_of(repeat, func):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100, help='Posts per page')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if renderers.orjson is None:
+        sys.exit('orjson is not installed, there is nothing to compare')
+
+    page = make_page(args.posts, random.Random(args.seed))
+    body = JSONRenderer().render(page)
+    assert renderers.FastJSONRenderer().render(page) == body
+
+    render_stdlib = best_of(args.repeat, lambda: JSONRenderer().render(page))
+    render_fast = best_of(args.repeat, lambda: renderers.FastJSONRenderer().render(page))
+    parse_stdlib = best_of(args.repeat, lambda: JSONParser().parse(io.BytesIO(body)))
+    parse_fast = best_of(args.repeat, lambda: renderers.FastJSONParser().parse(io.BytesIO(body)))
+    compressed = compress_string(body, max_random_bytes=0)
+    gzip_time = best_of(args.repeat, lambda: compress_string(body, max_random_bytes=0))
+
+    def line(label, seconds):
+        print(f'{label:<22}{seconds * 1e3:8.3f} ms/page {len(body) / seconds / 1e6:8.1f} MB/s')
+
+    print(f'{args.posts} posts per page, best of {args.repeat}')
+    line('render json:', render_stdlib)
+    line('render orjson:', render_fast)
+    print(f'render speedup:       {render_stdlib / render_fast:8.2f}x')
+    line('parse json:', parse_stdlib)
+    line('parse orjson:', parse_fast)
+    print(f'parse speedup:        {parse_stdlib / parse_fast:8.2f}x')
+    line('gzip:', gzip_time)
+    print(f'body:                 {len(body):8d} bytes')
+    print(f'gzipped body:         {len(compressed):8d} bytes ({len(compressed) / len(body):.1%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Per-object serialization cost of DynamicFieldsModelSerializer
+
+Serializes a large list of users with their nested profiles (the
+``UserSerializer.get_profile`` path, which builds one ProfileSerializer per
+user) with and without the per-process field layout cache.
+
+Usage: python benchmarks/bench_serializers.py [--objects 5000] [--repeat 5]
+Uses the project settings (SECRET_KEY must be set as for the app). No
+database is needed, the objects are never saved.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blogAPI.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+
+from core.models import Profile  # noqa: E402
+from core.serializers import DynamicFieldsModelSerializer, UserSerializer  # noqa: E402
+
+
+class NoLayoutCache(dict):
+    """ Stand-in for the layout cache that never remembers anything """
+
+    def __setitem__(self, key, value):
+        pass
+
+
+def make_users(count):
+    users = []
+    for i in range(count):
+        user = User(id=i + 1, username=f'user{i}', first_name='John', last_name='Doe')
+        user.profile = Profile(id=i + 1, user=user, bio='Lorem ipsum', profile_picture='profile/john_doe.png')
+        users.append(user)
+    return users
+
+
+def run(users, repeat):
+    context = {'requested_fields': ['profile', 'first_name', 'last_name']}
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        UserSerializer(users, many=True, context=context, fields=['id', 'username', 'profile']).data
+        best = min(best, time.perf_counter() - start)
+    return best / len(users) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--objects', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    users = make_users(args.objects)
+
+    cache = DynamicFieldsModelSerializer._field_layouts
+    DynamicFieldsModelSerializer._field_layouts = NoLayoutCache()
+    uncached = run(users, args.repeat)
+    DynamicFieldsModelSerializer._field_layouts = cache
+    cached = run(users, args.repeat)
+
+    print(f'objects: {args.objects}, best of {args.repeat}')
+    print(f'without layout cache: {uncached:8.1f} us/object')
+    print(f'with layout cache:    {cached:8.1f} us/object')
+    print(f'speedup:              {uncached / cached:8.2f}x')
+
+
+if __name__ == '__main__':
+    main()
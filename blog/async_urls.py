@@ -0,0 +1,15 @@
+from django.urls import path
+
+from . import async_views
+
+app_name = 'blog-async'
+
+urlpatterns = [
+    path('posts/', async_views.PostListView.as_view(), name='post-list'),
+    path('posts/<int:pk>/', async_views.PostDetailView.as_view(), name='post-detail'),
+    path('posts/<int:pk>/comments/', async_views.PostCommentsView.as_view(), name='post-comments'),
+    path('categories/', async_views.CategoryListView.as_view(), name='category-list'),
+    path('categories/<int:pk>/', async_views.CategoryDetailView.as_view(), name='category-detail'),
+    path('tags/', async_views.TagListView.as_view(), name='tag-list'),
+    path('tags/<int:pk>/', async_views.TagDetailView.as_view(), name='tag-detail'),
+]
@@ -0,0 +1,121 @@
+from django.http import HttpResponse
+from django.views import View
+
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+
+from core.renderers import FastJSONRenderer
+
+from .models import Post, Category, Tag, Comment
+from .pagination import AsyncLimitOffsetPagination, KeysetPagination, KeysetOnlyPagination
+from .serializers import PostSerializer, CategorySerializer, TagSerializer, PostCommentSerializer
+
+
+class AsyncReadView(View):
+    """Native async read endpoint, for deployments served over ASGI
+
+    Queries go through the async ORM API (``aiterator``/``aget``) instead of
+    a thread pool; serialization runs on objects already loaded, so any lazy
+    query left in it fails loudly instead of blocking the event loop. The
+    response bodies match the DRF viewsets; filtering, ordering, sparse
+    fieldsets and conditional GETs are only available on those.
+    """
+    http_method_names = ['get', 'head', 'options']
+    queryset = None
+    serializer_class = None
+
+    def get_queryset(self):
+        return self.queryset.all()
+
+    def get_serializer(self, *args, **kwargs):
+        return self.serializer_class(*args, context={'request': self.drf_request}, **kwargs)
+
+    def render(self, data, status=status.HTTP_200_OK):
+        return HttpResponse(FastJSONRenderer().render(data), content_type='application/json', status=status)
+
+    def not_found(self, detail='Not found.'):
+        return self.render({'detail': str(detail)}, status=status.HTTP_404_NOT_FOUND)
+
+    async def get(self, request, *args, **kwargs):
+        # Only used for its query_params and absolute URLs, never authenticated
+        self.drf_request = Request(request)
+        try:
+            return await self.aget_response(*args, **kwargs)
+        except NotFound as e:
+            return self.not_found(e.detail)
+
+
+class AsyncListView(AsyncReadView):
+    pagination_class = KeysetPagination
+
+    async def aget_response(self, *args, **kwargs):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(self.get_queryset(), self.drf_request, view=self)
+        serializer = self.get_serializer(page, many=True)
+        return self.render(paginator.get_paginated_data(serializer.data))
+
+
+class AsyncDetailView(AsyncReadView):
+
+    async def aget_response(self, pk):
+        try:
+            instance = await self.get_queryset().aget(pk=pk)
+        except self.queryset.model.DoesNotExist:
+            return self.not_found()
+        return self.render(self.get_serializer(instance).data)
+
+
+class PostListView(AsyncListView):
+    queryset = Post.objects.defer('search_vector').prefetch_related('categories', 'tags').order_by('-created_at', '-id')
+    serializer_class = PostSerializer
+
+
+class PostDetailView(AsyncDetailView):
+    queryset = Post.objects.defer('search_vector').prefetch_related('categories', 'tags')
+    serializer_class = PostSerializer
+
+
+class PostCommentsView(AsyncListView):
+    """ Async ``posts/{pk}/comments/`` """
+    serializer_class = PostCommentSerializer
+    pagination_class = KeysetOnlyPagination
+
+    def get_queryset(self):
+        return Comment.objects.filter(post_id=self.kwargs['pk']).select_related('author__user').only(
+            'id', 'post_id', 'content', 'created_at',
+            'author__id', 'author__profile_picture', 'author__user__username',
+        )
+
+    async def aget_response(self, pk):
+        paginator = self.pagination_class()
+        page = await paginator.apaginate_queryset(self.get_queryset(), self.drf_request, view=self)
+
+        # Only an empty first page needs to tell a missing post from a quiet one
+        if not page and not await Post.objects.filter(pk=pk).aexists():
+            return self.not_found()
+
+        serializer = self.get_serializer(page, many=True)
+        return self.render(paginator.get_paginated_data(serializer.data))
+
+
+class CategoryListView(AsyncListView):
+    queryset = Category.objects.order_by('id')
+    serializer_class = CategorySerializer
+    pagination_class = AsyncLimitOffsetPagination
+
+
+class CategoryDetailView(AsyncDetailView):
+    queryset = Category.objects.all()
+    serializer_class = CategorySerializer
+
+
+class TagListView(AsyncListView):
+    queryset = Tag.objects.order_by('id')
+    serializer_class = TagSerializer
+    pagination_class = AsyncLimitOffsetPagination
+
+
+class TagDetailView(AsyncDetailView):
+    queryset = Tag.objects.all()
+    serializer_class = TagSerializer
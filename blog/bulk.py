@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key field that can resolve pks from objects loaded up front
+
+    Bulk endpoints put ``{model: {pk: instance}}`` under ``preloaded`` in the
+    serializer context, so validating a batch costs one query per related
+    model instead of one per item and value.
+    """
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded')
+        model = self.get_queryset().model
+        if preloaded is None or model not in preloaded:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except ValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+        instance = preloaded[model].get(pk)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class BulkCreateMixin:
+    """``POST <list>/bulk/`` creating a whole batch of objects at once
+
+    The batch is validated in one pass, with related objects preloaded by
+    ``preload_related``, then written with one ``bulk_create`` for the rows
+    and one per many-to-many relation for the through rows. Nothing is
+    written unless every item is valid; errors are reported by item index.
+    Signals don't fire for bulk inserts, so ``after_bulk_create`` is where
+    viewsets keep denormalized data up to date.
+    """
+    bulk_batch_size = 1000
+
+    def get_bulk_extra_fields(self):
+        """ Values set on every created object, like ``perform_create`` would """
+        return {}
+
+    def after_bulk_create(self, instances):
+        pass
+
+    def preload_related(self, child, items):
+        wanted = {}
+        for name, field in child.fields.items():
+            if field.read_only:
+                continue
+            many = isinstance(field, serializers.ManyRelatedField)
+            relation = field.child_relation if many else field
+            if not isinstance(relation, PreloadedPrimaryKeyRelatedField):
+                continue
+
+            model = relation.get_queryset().model
+            pks = wanted.setdefault(model, set())
+            for item in items:
+                if not isinstance(item, dict) or name not in item:
+                    continue
+                values = item[name] if many else [item[name]]
+                if not isinstance(values, list):
+                    continue
+                for value in values:
+                    try:
+                        pks.add(model._meta.pk.to_python(value))
+                    except (ValidationError, TypeError):
+                        pass
+
+        return {model: model._default_manager.in_bulk(pks) for model, pks in wanted.items()}
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'errors': ['Expected a list of items.']}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.BULK_CREATE_MAX_ITEMS:
+            return Response(
+                {'errors': [f'At most {settings.BULK_CREATE_MAX_ITEMS} items can be created at once.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        context = self.get_serializer_context()
+        child = self.get_serializer_class()(context=context)
+        context['preloaded'] = self.preload_related(child, items)
+
+        serializer = self.get_serializer_class()(data=items, many=True, context=context)
+        if not serializer.is_valid():
+            errors = [
+                {'index': index, 'errors': item_errors}
+                for index, item_errors in enumerate(serializer.errors) if item_errors
+            ]
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            instances = self.perform_bulk_create(serializer.validated_data)
+            self.after_bulk_create(instances)
+
+        return Response({
+            'created': len(instances),
+            'ids': [instance.pk for instance in instances],
+        }, status=status.HTTP_201_CREATED)
+
+    def perform_bulk_create(self, validated_data):
+        model = self.get_queryset().model
+        m2m_fields = [field for field in model._meta.many_to_many]
+        m2m_names = {field.name for field in m2m_fields}
+        extra = self.get_bulk_extra_fields()
+
+        instances = [
+            model(**{key: value for key, value in item.items() if key not in m2m_names}, **extra)
+            for item in validated_data
+        ]
+        model._default_manager.bulk_create(instances, batch_size=self.bulk_batch_size)
+
+        for field in m2m_fields:
+            through = field.remote_field.through
+            source = f'{field.m2m_field_name()}_id'
+            target = f'{field.m2m_reverse_field_name()}_id'
+            rows = [
+                through(**{source: instance.pk, target: related_pk})
+                for instance, item in zip(instances, validated_data)
+                for related_pk in {related.pk for related in item.get(field.name, [])}
+            ]
+            through._default_manager.bulk_create(rows, batch_size=self.bulk_batch_size)
+
+        return instances
@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from rest_framework.response import Response
+
+from core import metrics
+
+
+def version_key(model):
+    return f'blog:version:{model._meta.label_lower}'
+
+
+def get_version(model):
+    # Start from a timestamp so an evicted version key never resurrects old entries
+    return cache.get_or_set(version_key(model), time.time_ns, timeout=None)
+
+
+def bump_version(model):
+    """ Invalidate every cached response of ``model`` at once """
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.set(version_key(model), time.time_ns(), timeout=None)
+
+
+class VersionedCacheMixin:
+    """Cache serialized list and detail responses of a read-only viewset
+
+    Entries are keyed by the model's cache version and the request path, so
+    bumping the version (see ``bump_version``) invalidates them all without
+    having to know which pages were cached. A bump only reaches the processes
+    sharing the cache, so nothing is cached unless TAXONOMY_CACHE_ENABLED.
+    """
+    cache_timeout = settings.TAXONOMY_CACHE_TIMEOUT
+
+    def get_cache_key(self, request):
+        model = self.get_queryset().model
+        return f'blog:response:{model._meta.label_lower}:{get_version(model)}:{request.get_full_path()}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not settings.TAXONOMY_CACHE_ENABLED:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            metrics.CACHE_REQUESTS.inc('blog_response', 'hit')
+            return Response(data)
+
+        metrics.CACHE_REQUESTS.inc('blog_response', 'miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, self.cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,119 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from rest_framework.response import Response
+
+from core.storage import picture_url_window
+
+
+class ConditionalGetMixin:
+    """Answer polling clients with 304 Not Modified when nothing changed
+
+    Responses carry a weak ETag derived from ``last_modified_field`` of the
+    rows they render, so anything changing a row, denormalized counters
+    included, must move that field (see ``Post.changed_at``). Related rows
+    rendered in the response are covered by ``related_modified_fields``,
+    lookups of their timestamps such as ``'author__updated_at'``, and
+    responses rendering presigned picture URLs set ``etag_picture_urls`` so
+    the ETag changes along with the URLs (see ``S3Storage.url_window``).
+    Everything comes from the database or the clock, so all workers agree.
+
+    Lists are validated from the page itself: the paginator runs its usual
+    queries and the ETag covers the ids and timestamps of the page, its
+    count and its links, so a matching request costs the page query but
+    skips serialization. Details are validated with a single lightweight
+    query before the object is loaded.
+
+    Last-Modified is only sent on detail responses depending on their own
+    row alone: elsewhere a deletion, a related object or a new picture URL
+    can change the response while the newest timestamp stays the same.
+    """
+    last_modified_field = 'updated_at'
+    related_modified_fields = []
+    etag_picture_urls = False
+
+    def get_etag(self, request, state):
+        fmt = getattr(request, 'accepted_renderer', None)
+        fmt = fmt.format if fmt else ''
+        window = picture_url_window() if self.etag_picture_urls else None
+        digest = hashlib.md5(
+            f'{request.get_full_path()}|{fmt}|{state}|{window}'.encode()
+        ).hexdigest()
+        return f'W/"{digest}"'
+
+    def get_row_state(self, obj):
+        """ What identifies the rendering of one row, for the list ETag """
+        state = [obj.pk, getattr(obj, self.last_modified_field)]
+        for lookup in self.related_modified_fields:
+            state.append(self.get_related_value(obj, lookup))
+        return tuple(state)
+
+    def get_related_value(self, obj, lookup):
+        """Value of ``lookup`` from the related rows already loaded with ``obj``
+
+        Relations left out of the query (a sparse fieldset skipping them)
+        aren't rendered either, so they count as None rather than costing a
+        query per row.
+        """
+        *relations, name = lookup.split('__')
+        for relation in relations:
+            if obj is None or not obj._meta.get_field(relation).is_cached(obj):
+                return None
+            obj = getattr(obj, relation)
+        return None if obj is None else obj.__dict__.get(name)
+
+    def conditional_response(self, request, etag, respond, timestamp=None):
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = respond()
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+
+        state = [self.get_row_state(obj) for obj in rows]
+        if page is not None:
+            paginator = self.paginator
+            state += [getattr(paginator, 'count', None), paginator.get_next_link(), paginator.get_previous_link()]
+
+        def respond():
+            serializer = self.get_serializer(rows, many=True)
+            if page is not None:
+                return self.get_paginated_response(serializer.data)
+            return Response(serializer.data)
+
+        return self.conditional_response(request, self.get_etag(request, state), respond)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        try:
+            state = queryset.filter(
+                **{self.lookup_field: kwargs[lookup_url_kwarg]}
+            ).values_list(self.last_modified_field, *self.related_modified_fields).first()
+        except (TypeError, ValueError, ValidationError):
+            state = None
+
+        # Let the regular path raise the 404
+        if state is None:
+            return super().retrieve(request, *args, **kwargs)
+
+        timestamp = None
+        if not self.related_modified_fields and not self.etag_picture_urls:
+            timestamp = int(state[0].timestamp())
+        return self.conditional_response(
+            request,
+            self.get_etag(request, state),
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs),
+            timestamp,
+        )
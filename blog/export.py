@@ -0,0 +1,167 @@
+"""Streaming NDJSON export of posts and comments
+
+One JSON object per line. The first line describes the export; its
+``next_since`` is what to pass as ``since`` next time to only get the rows
+created or updated in between. Rows are read with ``iterator()`` (a
+server-side cursor on Postgres) and written as they come, so memory stays
+flat whatever the size of the corpus.
+
+Posts are compared on ``changed_at``, which unlike ``updated_at`` also
+moves when their comment count does; comments on ``updated_at``. Both are
+set from the clock of the server saving the row, before its transaction
+commits, so a row can become visible after an export that started later.
+``next_since`` is therefore ``EXPORT_SINCE_OVERLAP`` seconds before the
+start of the export: delivery is at least once, and consumers keep the row
+with the latest ``changed_at`` (``updated_at`` for comments).
+The overlap has to cover the longest write transaction, the clock skew
+between servers and, when reading from a replica, its lag.
+"""
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rest_framework import permissions, views
+from rest_framework.exceptions import ValidationError
+
+from core.renderers import FastJSONRenderer
+
+from .models import Comment, Post
+
+TYPES = ('posts', 'comments')
+CHUNK_SIZE = 2000
+CONTENT_TYPE = 'application/x-ndjson'
+
+POST_FIELDS = ('id', 'title', 'content', 'author_id', 'comment_count', 'created_at', 'updated_at', 'changed_at')
+COMMENT_FIELDS = ('id', 'post_id', 'author_id', 'content', 'created_at', 'updated_at')
+
+
+def parse_since(value):
+    """ ``since`` as an aware datetime, ``None`` when not given """
+    if not value:
+        return None
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError(f'{value!r} is not an ISO 8601 date and time')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since)
+    return since
+
+
+def parse_types(value):
+    types = [name.strip() for name in value.split(',') if name.strip()] if value else list(TYPES)
+    unknown = set(types) - set(TYPES)
+    if unknown:
+        raise ValueError(f'Unknown export types: {", ".join(sorted(unknown))}')
+    return types
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def related_ids(field, post_ids, using):
+    """ ``{post_id: [ids]}`` of a many-to-many field of Post, for a chunk of posts """
+    through = field.remote_field.through
+    target = field.m2m_reverse_field_name()
+    related = {}
+    rows = through._default_manager.using(using).filter(post_id__in=post_ids).values_list('post_id', target)
+    for post_id, target_id in rows.order_by('post_id', target):
+        related.setdefault(post_id, []).append(target_id)
+    return related
+
+
+def iter_posts(since=None, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    queryset = Post.objects.using(using).order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(changed_at__gt=since)
+    rows = queryset.values_list(*POST_FIELDS).iterator(chunk_size=chunk_size)
+    categories_field = Post._meta.get_field('categories')
+    tags_field = Post._meta.get_field('tags')
+
+    for chunk in chunked(rows, chunk_size):
+        # Two queries per chunk for the ids of categories and tags
+        post_ids = [row[0] for row in chunk]
+        categories = related_ids(categories_field, post_ids, using)
+        tags = related_ids(tags_field, post_ids, using)
+        for post_id, title, content, author_id, comment_count, created_at, updated_at, changed_at in chunk:
+            yield {
+                'type': 'post',
+                'id': post_id,
+                'title': title,
+                'content': content,
+                'author': author_id,
+                'categories': categories.get(post_id, []),
+                'tags': tags.get(post_id, []),
+                'comment_count': comment_count,
+                'created_at': created_at,
+                'updated_at': updated_at,
+                'changed_at': changed_at,
+            }
+
+
+def iter_comments(since=None, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    queryset = Comment.objects.using(using).order_by('pk')
+    if since is not None:
+        queryset = queryset.filter(updated_at__gt=since)
+    for comment_id, post_id, author_id, content, created_at, updated_at in (
+        queryset.values_list(*COMMENT_FIELDS).iterator(chunk_size=chunk_size)
+    ):
+        yield {
+            'type': 'comment',
+            'id': comment_id,
+            'post': post_id,
+            'author': author_id,
+            'content': content,
+            'created_at': created_at,
+            'updated_at': updated_at,
+        }
+
+
+def export_lines(types=TYPES, since=None, using=DEFAULT_DB_ALIAS, chunk_size=CHUNK_SIZE):
+    """ The export as NDJSON lines (bytes) """
+    renderer = FastJSONRenderer()
+    # Taken before the first row is read
+    started_at = timezone.now()
+    yield renderer.render({
+        'type': 'export',
+        'started_at': started_at,
+        'next_since': started_at - timedelta(seconds=settings.EXPORT_SINCE_OVERLAP),
+        'since': since,
+        'types': list(types),
+    }) + b'\n'
+
+    sources = {'posts': iter_posts, 'comments': iter_comments}
+    for name in types:
+        for row in sources[name](since=since, using=using, chunk_size=chunk_size):
+            yield renderer.render(row) + b'\n'
+
+
+class ExportView(views.APIView):
+    """Every post and comment as NDJSON, for copying the corpus
+
+    Query parameters: ``since`` (ISO 8601) to only export rows updated after
+    it, ``types`` (``posts``, ``comments`` or both, comma separated).
+    """
+    permission_classes = [permissions.IsAdminUser]
+    chunk_size = CHUNK_SIZE
+
+    def get(self, request, *args, **kwargs):
+        try:
+            since = parse_since(request.query_params.get('since'))
+            types = parse_types(request.query_params.get('types'))
+        except ValueError as e:
+            raise ValidationError({'detail': str(e)})
+
+        # The primary, a lagging replica could miss rows older than next_since
+        using = router.db_for_write(Post)
+        lines = export_lines(types, since, using, self.chunk_size)
+        response = StreamingHttpResponse(lines, content_type=CONTENT_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="blog-export.ndjson"'
+        return response
@@ -0,0 +1,93 @@
+from django.core.exceptions import FieldDoesNotExist
+
+from rest_framework import permissions, serializers
+
+from core.serializers import DynamicFieldsModelSerializer
+
+
+class SparseFieldsetMixin:
+    """Let clients pick the serialized fields with ``?fields=`` / ``?exclude=``
+
+    Both take a comma separated list of field names. The serializer is pruned
+    through ``DynamicFieldsModelSerializer`` and the queryset is narrowed to
+    match: unused columns are deferred with ``.only()`` and prefetches or joins
+    feeding pruned fields are dropped, so e.g. a list of post titles never
+    reads post bodies. Only applies to safe (read) requests.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+    # Columns always loaded, e.g. the ones pagination reads from the rows
+    sparse_required_fields = ['id']
+
+    def get_sparse_fieldset(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in permissions.SAFE_METHODS:
+            return {}
+        if not issubclass(self.get_serializer_class(), DynamicFieldsModelSerializer):
+            return {}
+
+        fieldset = {}
+        for param in (self.fields_query_param, self.exclude_query_param):
+            value = request.query_params.get(param)
+            if value is not None:
+                fieldset[param] = [name.strip() for name in value.split(',') if name.strip()]
+        return fieldset
+
+    def get_serializer(self, *args, **kwargs):
+        for param, names in self.get_sparse_fieldset().items():
+            kwargs.setdefault(param, names)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.get_sparse_fieldset():
+            return queryset
+
+        sources = set()
+        for field in self.get_serializer().fields.values():
+            # Method fields and whole-object sources may read any attribute
+            if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+                return queryset
+            sources.add(field.source.split('.')[0])
+        return self.restrict_queryset(queryset, sources)
+
+    def restrict_queryset(self, queryset, sources):
+        opts = queryset.model._meta
+        columns = set(self.sparse_required_fields)
+        relations = set()
+        for name in sources:
+            try:
+                model_field = opts.get_field(name)
+            except FieldDoesNotExist:
+                # Annotations and properties are left alone
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(name)
+            else:
+                relations.add(name)
+
+        prefetches = [
+            lookup for lookup in queryset._prefetch_related_lookups
+            if str(getattr(lookup, 'prefetch_through', lookup)).split('__')[0] in relations
+        ]
+        queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+
+        select_related = queryset.query.select_related
+        if isinstance(select_related, dict):
+            kept = [name for name in select_related if name in columns]
+            if len(kept) != len(select_related):
+                queryset = queryset.select_related(None)
+                for name in kept:
+                    queryset = queryset.select_related(*self.related_paths(name, select_related[name]))
+
+        return queryset.only(*columns)
+
+    @classmethod
+    def related_paths(cls, prefix, tree):
+        """ Flatten a ``query.select_related`` tree back into lookups """
+        if not tree:
+            return [prefix]
+        paths = []
+        for name, subtree in tree.items():
+            paths.extend(cls.related_paths(f'{prefix}__{name}', subtree))
+        return paths
@@ -0,0 +1,23 @@
+from rest_framework import filters
+
+from .search import search_posts
+
+
+class PostSearchFilter(filters.BaseFilterBackend):
+    """ Full-text search over post titles and contents, ordered by relevance """
+    search_param = 'search'
+
+    def get_search_term(self, request):
+        return request.query_params.get(self.search_param, '').strip()
+
+    def filter_queryset(self, request, queryset, view):
+        term = self.get_search_term(request)
+        if not term:
+            return queryset
+        return search_posts(queryset, term)
+
+    def get_schema_fields(self, view):
+        return filters.SearchFilter().get_schema_fields(view)
+
+    def get_schema_operation_parameters(self, view):
+        return filters.SearchFilter().get_schema_operation_parameters(view)
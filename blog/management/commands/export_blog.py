@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from blog.export import CHUNK_SIZE, export_lines, parse_since, parse_types
+
+
+class Command(BaseCommand):
+    help = 'Stream every post and comment as NDJSON, see blog.export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since',
+                            help='Only export rows updated after this ISO 8601 date and time, e.g. '
+                                 'the next_since of the previous export')
+        parser.add_argument('--types', default='posts,comments',
+                            help='What to export: posts, comments or both, comma separated')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Rows fetched from the database at a time')
+        parser.add_argument('--output', help='File to write to instead of stdout')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='Database to read from; a replica must lag less than EXPORT_SINCE_OVERLAP')
+
+    def handle(self, *args, **options):
+        try:
+            since = parse_since(options['since'])
+            types = parse_types(options['types'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        lines = export_lines(types, since, options['database'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                output.writelines(lines)
+        else:
+            # Bytes straight to stdout, the command's text wrapper would decode them
+            stdout = getattr(self.stdout._out, 'buffer', None)
+            for line in lines:
+                if stdout is not None:
+                    stdout.write(line)
+                else:
+                    self.stdout.write(line.decode(), ending='')
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from blog import search
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search data of every post'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+
+        if search.is_postgres(using):
+            updated = Post.objects.using(using).update(search_vector=search.post_search_vector())
+        else:
+            search.create_search_tables(using=using)
+            with connections[using].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {search.FTS_TABLE}')
+                cursor.execute(
+                    f'INSERT INTO {search.FTS_TABLE} (rowid, title, content) '
+                    f'SELECT id, title, content FROM {Post._meta.db_table}'
+                )
+                updated = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {updated} posts'))
@@ -0,0 +1,252 @@
+import itertools
+from array import array
+from collections import Counter
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from blog import cache, search
+from blog.models import Category, Comment, Post, Tag
+from core.models import Profile
+
+WORDS = (
+    'django python database index query cache replica latency throughput api post comment '
+    'author tag category search page cursor request response server worker queue thread '
+    'async pool connection transaction lock row table column vector rank token session '
+    'deploy release build test benchmark profile memory disk network storage upload image '
+    'the a of and to in is it for on with as at by from this that be are was or an not'
+).split()
+
+# COPY gets no defaults from Django, every NOT NULL column has to be listed
+POST_COLUMNS = ('id', 'title', 'content', 'author_id', 'comment_count', 'created_at', 'updated_at', 'changed_at')
+COMMENT_COLUMNS = ('id', 'post_id', 'author_id', 'content', 'created_at', 'updated_at')
+
+
+def zipf_cum_weights(count, exponent):
+    """ Cumulative weights of ranks 1..count under Zipf's law """
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """ Let bulk_create keep the given auto_now/auto_now_add values """
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with synthetic users, posts and comments for scale testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--tags', type=int, default=200)
+        parser.add_argument('--days', type=int, default=365,
+                            help='Posts are spread over this many days before now')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent of the author, tag, category and comment mixes')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed, the same seed generates the same data')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows written per bulk_create or COPY')
+        parser.add_argument('--password', default='seed-pass-123',
+                            help='Password of every generated user')
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Use bulk_create on Postgres too instead of COPY')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.zipf = options['zipf']
+        self.use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        self.now = timezone.now()
+        self.started = time.monotonic()
+
+        with explicit_timestamps(Post, Comment):
+            profile_ids = self.create_users(options['users'], options['password'])
+            category_ids = self.create_taxonomy(Category, options['categories'])
+            tag_ids = self.create_taxonomy(Tag, options['tags'])
+            comment_posts = self.assign_comments(options['comments'], options['posts'])
+            post_ids, post_ages = self.create_posts(
+                options['posts'], options['days'], profile_ids, category_ids, tag_ids, Counter(comment_posts)
+            )
+            self.create_comments(comment_posts, post_ids, post_ages, profile_ids)
+
+        if connection.vendor == 'postgresql':
+            # Ids were assigned here, move the sequences past them
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Post, Comment]):
+                    cursor.execute(sql)
+
+        cache.bump_version(Category)
+        cache.bump_version(Tag)
+        self.stdout.write(self.style.SUCCESS(f'Seeded the database in {self.elapsed()}'))
+
+    def elapsed(self):
+        return f'{time.monotonic() - self.started:.1f}s'
+
+    def progress(self, label, done, total):
+        self.stdout.write(f'{label}: {done}/{total} ({self.elapsed()})')
+
+    def insert(self, model, columns, rows):
+        """ Write value tuples for ``columns`` (attribute names), with COPY on Postgres """
+        if not rows:
+            return
+        if not self.use_copy:
+            model._default_manager.bulk_create(
+                [model(**dict(zip(columns, row))) for row in rows], batch_size=self.batch_size
+            )
+            return
+
+        opts = model._meta
+        column_list = ', '.join(connection.ops.quote_name(opts.get_field(name).column) for name in columns)
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(f'COPY {connection.ops.quote_name(opts.db_table)} ({column_list}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row(row)
+
+    def chunks(self, total):
+        for start in range(0, total, self.batch_size):
+            yield range(start, min(start + self.batch_size, total))
+
+    def text(self, words, cum_weights, low, high):
+        return ' '.join(self.rng.choices(words, cum_weights=cum_weights, k=self.rng.randint(low, high)))
+
+    def zipf_picker(self, population):
+        """ ``pick(k)`` drawing ``k`` values, the first ones of a shuffled ``population`` most often """
+        population = list(population)
+        self.rng.shuffle(population)
+        cum_weights = zipf_cum_weights(len(population), self.zipf)
+        return lambda k=1: self.rng.choices(population, cum_weights=cum_weights, k=k)
+
+    def create_users(self, count, password):
+        # Hashing once is enough; every user gets the same (valid) password
+        encoded = make_password(password)
+        start = User.objects.aggregate(last=Max('pk'))['last'] or 0
+        profile_ids = []
+        for chunk in self.chunks(count):
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=f'seed{start + i + 1}', email=f'seed{start + i + 1}@example.com',
+                         password=encoded, first_name='Seed', last_name=f'User {i + 1}')
+                    for i in chunk
+                ], batch_size=self.batch_size)
+                # bulk_create skips the receiver creating profiles
+                profiles = Profile.objects.bulk_create(
+                    [Profile(user_id=user.pk) for user in users], batch_size=self.batch_size
+                )
+            profile_ids.extend(profile.pk for profile in profiles)
+            self.progress('Users', chunk.stop, count)
+        return profile_ids
+
+    def create_taxonomy(self, model, count):
+        label = model._meta.verbose_name
+        start = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        objects = model.objects.bulk_create([
+            model(name=f'{label.title()} {start + i + 1}', slug=f'seed-{label}-{start + i + 1}')
+            for i in range(count)
+        ], batch_size=self.batch_size)
+        return [obj.pk for obj in objects]
+
+    def assign_comments(self, count, post_count):
+        """Index of the post of every comment
+
+        Drawn before the posts are written so they get their comment_count
+        right away; recounting afterwards would move changed_at on every post.
+        """
+        comment_posts = array('l')
+        if not post_count:
+            return comment_posts
+        pick_post = self.zipf_picker(range(post_count))
+        for chunk in self.chunks(count):
+            comment_posts.extend(pick_post(len(chunk)))
+        return comment_posts
+
+    def create_posts(self, count, days, profile_ids, category_ids, tag_ids, comment_counts):
+        pick_author = self.zipf_picker(profile_ids)
+        pick_category = self.zipf_picker(category_ids)
+        pick_tag = self.zipf_picker(tag_ids)
+        word_weights = zipf_cum_weights(len(WORDS), self.zipf)
+        categories_through = Post.categories.through
+        tags_through = Post.tags.through
+
+        first_id = (Post.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+        span = days * 24 * 3600
+        post_ids = range(first_id, first_id + count)
+        # Age of every post in seconds, much smaller than a list of datetimes
+        post_ages = array('d')
+
+        for chunk in self.chunks(count):
+            posts, categories, tags = [], [], []
+            for i in chunk:
+                post_id = first_id + i
+                age = self.rng.random() * span
+                post_ages.append(age)
+                created_at = self.now - timedelta(seconds=age)
+                posts.append((
+                    post_id,
+                    self.text(WORDS, word_weights, 4, 10).capitalize(),
+                    self.text(WORDS, word_weights, 40, 200),
+                    pick_author()[0],
+                    comment_counts[i],
+                    created_at,
+                    created_at,
+                    created_at,
+                ))
+                categories.extend((post_id, pk) for pk in set(pick_category(self.rng.randint(1, 3))))
+                tags.extend((post_id, pk) for pk in set(pick_tag(self.rng.randint(1, 5))))
+
+            with transaction.atomic():
+                self.insert(Post, POST_COLUMNS, posts)
+                self.insert(categories_through, ['post_id', 'category_id'], categories)
+                self.insert(tags_through, ['post_id', 'tag_id'], tags)
+                search.index_posts([Post(pk=row[0], title=row[1], content=row[2]) for row in posts])
+            self.progress('Posts', chunk.stop, count)
+
+        return post_ids, post_ages
+
+    def create_comments(self, comment_posts, post_ids, post_ages, profile_ids):
+        count = len(comment_posts)
+        pick_author = self.zipf_picker(profile_ids)
+        word_weights = zipf_cum_weights(len(WORDS), self.zipf)
+        first_id = (Comment.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+        for chunk in self.chunks(count):
+            comments = []
+            for i in chunk:
+                index = comment_posts[i]
+                # Some time between the post and now
+                created_at = self.now - timedelta(seconds=post_ages[index] * self.rng.random())
+                comments.append((
+                    first_id + i,
+                    post_ids[index],
+                    pick_author()[0],
+                    self.text(WORDS, word_weights, 5, 60),
+                    created_at,
+                    created_at,
+                ))
+
+            with transaction.atomic():
+                self.insert(Comment, COMMENT_COLUMNS, comments)
+            self.progress('Comments', chunk.stop, count)
@@ -1,7 +1,16 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from core.models import Profile
 
+from . import cache, search
+
 class Category(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True)
@@ -24,15 +33,108 @@ class Post(models.Model):
     tags = models.ManyToManyField(Tag, related_name='posts')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Moves with updated_at and on counter changes as well; what ETags and
+    # incremental exports compare, while updated_at only tracks edits
+    changed_at = models.DateTimeField(auto_now=True, editable=False)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # Denormalized counters, kept in sync by the receivers below and rebuilt
+    # with `manage.py rebuild_post_counters`
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='post_created_at_id_idx'),
+            models.Index(fields=['comment_count', 'id'], name='post_comment_count_idx'),
+            GinIndex(fields=['search_vector'], name='post_search_vector_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+def adjust_comment_counts(deltas, using='default'):
+    """Add ``{post_id: delta}`` to the comment counts, in one UPDATE
+
+    ``changed_at`` is moved as well, so ETags and incremental exports see
+    the new counts; ``updated_at`` is left to edits of the post.
+    """
+    deltas = {post_id: delta for post_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    change = Case(
+        *[When(pk=post_id, then=Value(delta)) for post_id, delta in deltas.items()],
+        output_field=IntegerField(),
+    )
+    Post.objects.using(using).filter(pk__in=deltas).update(
+        comment_count=Greatest(F('comment_count') + change, Value(0)),
+        changed_at=timezone.now(),
+    )
+
+
+class CommentQuerySet(models.QuerySet):
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            counts = self.order_by().values('post_id').annotate(total=Count('pk')).values_list('post_id', 'total')
+            deltas = {post_id: -total for post_id, total in counts}
+            result = super().delete()
+            adjust_comment_counts(deltas, using=self.db)
+        return result
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE)
     author = models.ForeignKey(Profile, on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = CommentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='comment_created_at_id_idx'),
+            models.Index(fields=['post', 'created_at', 'id'], name='comment_post_created_at_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.user.username} on {self.post.title}'
+
+    def delete(self, using=None, keep_parents=False):
+        # Counted here rather than in a post_delete receiver, which would turn
+        # off the fast cascade delete of a post's comments. Comments removed
+        # by a cascade from their author are left to rebuild_post_counters.
+        using = using or self._state.db
+        with transaction.atomic(using=using):
+            result = super().delete(using=using, keep_parents=keep_parents)
+            adjust_comment_counts({self.post_id: -1}, using=using)
+        return result
+
+
+@receiver(post_save, sender=Post)
+def update_post_search_index(sender, instance, using, update_fields=None, **kwargs):
+    """ Keep the search data in sync with the post title and content """
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    search.index_post(instance, using=using)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_search_index(sender, instance, using, **kwargs):
+    search.unindex_post(instance, using=using)
+
+
+@receiver(post_save, sender=Comment)
+def increment_comment_count(sender, instance, created, using, **kwargs):
+    if created:
+        adjust_comment_counts({instance.post_id: 1}, using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_taxonomy_cache(sender, **kwargs):
+    """ Drop cached category and tag responses whenever one of them changes """
+    cache.bump_version(sender)
+
@@ -0,0 +1,218 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from urllib import parse
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+async def alist(queryset):
+    """ Evaluate ``queryset`` from async code """
+    # aiterator() can't be combined with prefetch_related() before Django 5.0,
+    # async iteration over the queryset itself can
+    if queryset._prefetch_related_lookups:
+        return [obj async for obj in queryset]
+    return [obj async for obj in queryset.aiterator()]
+
+
+class AsyncLimitOffsetPagination(LimitOffsetPagination):
+    """ LimitOffsetPagination that async views can drive with ``apaginate_queryset`` """
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """ ``paginate_queryset`` running the queries through the async ORM API """
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.count = await queryset.acount()
+        self.offset = self.get_offset(request)
+        if self.count == 0 or self.offset > self.count:
+            return []
+        return await alist(queryset[self.offset:self.offset + self.limit])
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class KeysetPagination(AsyncLimitOffsetPagination):
+    """Limit/offset pagination with an opt-in keyset (cursor) mode
+
+    Requests without a ``cursor`` parameter behave exactly like
+    ``LimitOffsetPagination``. Passing ``?cursor=`` (empty for the first page)
+    switches to seeking on ``(created_at, id)``: each page is a single index
+    range scan starting right after the previous page and no COUNT(*) is run,
+    so deep pages cost the same as the first one.
+
+    Views using it should keep a composite index on ``keyset_fields``.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    keyset_fields = ('created_at', 'id')
+    keyset_only = False
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_only or self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        queryset = self.seek(queryset, request)
+        if queryset is None:
+            return None
+        # Fetch one extra row to know whether another page exists
+        return self.set_page(list(queryset[:self.limit + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.keyset_only or self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return await super().apaginate_queryset(queryset, request, view)
+
+        queryset = self.seek(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(await alist(queryset[:self.limit + 1]))
+
+    def seek(self, queryset, request):
+        """ Order and filter ``queryset`` to start right after the requested cursor """
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.position, self.reverse = self.decode_cursor(request)
+        time_field, id_field = self.keyset_fields
+
+        if self.reverse:
+            queryset = queryset.order_by(time_field, id_field)
+        else:
+            queryset = queryset.order_by(f'-{time_field}', f'-{id_field}')
+
+        if self.position is not None:
+            created_at, pk = self.position
+            if self.reverse:
+                queryset = queryset.filter(
+                    Q(**{f'{time_field}__gte': created_at}),
+                    Q(**{f'{time_field}__gt': created_at}) | Q(**{f'{id_field}__gt': pk}),
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{time_field}__lte': created_at}),
+                    Q(**{f'{time_field}__lt': created_at}) | Q(**{f'{id_field}__lt': pk}),
+                )
+        return queryset
+
+    def set_page(self, results):
+        """ Trim the extra row fetched by ``seek`` callers and work out the page links """
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if self.reverse:
+            results.reverse()
+            self.has_next = self.position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.position is not None
+
+        self.page = results
+        self.display_page_controls = False
+        return results
+
+    def get_paginated_data(self, data):
+        if not self.keyset:
+            return super().get_paginated_data(data)
+
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            created_at = parse_datetime(tokens['p'][0])
+            pk = int(tokens['i'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return (created_at, pk), reverse
+
+    def encode_cursor(self, instance, reverse):
+        time_field, id_field = self.keyset_fields
+        tokens = {
+            'p': getattr(instance, time_field).isoformat(),
+            'i': getattr(instance, id_field),
+        }
+        if reverse:
+            tokens['r'] = '1'
+
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        url = remove_query_param(self.request.build_absolute_uri(), self.offset_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+
+class KeysetOnlyPagination(KeysetPagination):
+    """ Keyset pagination without the limit/offset fallback """
+    keyset_only = True
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator trusting the Postgres planner's row estimate on large tables
+
+    An exact ``COUNT(*)`` reads the whole table (or index) and takes seconds
+    at millions of rows; ``EXPLAIN`` only asks the planner. Estimates of
+    ``ADMIN_EXACT_COUNT_LIMIT`` rows or fewer are counted exactly, as are
+    all counts on other databases, so small results stay precise.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.order_by().explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return queryset.count()
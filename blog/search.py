@@ -0,0 +1,159 @@
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+import re
+
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.expressions import RawSQL
+
+# Title matches rank above content matches
+TITLE_WEIGHT = 'A'
+CONTENT_WEIGHT = 'B'
+
+# SQLite FTS5 fallback, used when the database is not Postgres
+FTS_TABLE = 'blog_post_fts'
+FTS_TITLE_BM25_WEIGHT = 10.0
+FTS_CONTENT_BM25_WEIGHT = 1.0
+
+HEADLINE_START = '<b>'
+HEADLINE_STOP = '</b>'
+HEADLINE_WORDS = 16
+
+
+def post_search_vector():
+    """ Weighted search vector stored in Post.search_vector """
+    return (
+        SearchVector('title', weight=TITLE_WEIGHT)
+        + SearchVector('content', weight=CONTENT_WEIGHT)
+    )
+
+
+def is_postgres(using):
+    return connections[using].vendor == 'postgresql'
+
+
+def create_search_tables(using='default', **kwargs):
+    """ Create the FTS5 table backing search on SQLite databases """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+            f'USING fts5(title, content, tokenize="porter unicode61")'
+        )
+
+
+def index_post(post, using='default'):
+    """ Refresh the search data of a single post after it was saved """
+    if is_postgres(using):
+        type(post)._default_manager.using(using).filter(pk=post.pk).update(
+            search_vector=post_search_vector()
+        )
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+            [post.pk, post.title, post.content],
+        )
+
+
+def index_posts(posts, using='default'):
+    """ Bulk version of ``index_post``, for posts inserted with ``bulk_create`` """
+    if not posts:
+        return
+    if is_postgres(using):
+        type(posts[0])._default_manager.using(using).filter(pk__in=[post.pk for post in posts]).update(
+            search_vector=post_search_vector()
+        )
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, content) VALUES (%s, %s, %s)',
+            [(post.pk, post.title, post.content) for post in posts],
+        )
+
+
+def unindex_post(post, using='default'):
+    if is_postgres(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+
+
+def fts_match_expression(term, prefix=False):
+    """ Quote every word so user input can't inject FTS5 query syntax """
+    words = term.split()
+    suffix = '*' if prefix else ''
+    return ' '.join('"%s"%s' % (word.replace('"', '""'), suffix) for word in words)
+
+
+def prefix_tsquery(term):
+    """ Raw tsquery matching documents with words starting with every word of ``term`` """
+    return ' & '.join(f"'{word}':*" for word in re.findall(r'\w+', term))
+
+
+def match_condition(term, using='default', prefix=False):
+    """``Q`` of the posts matching ``term`` through the search index
+
+    With ``prefix``, words also match longer words starting with them, for
+    lookups as you type. Combine it with conditions on Post columns only; an
+    OR with a joined table can't be answered from the index.
+    """
+    if is_postgres(using):
+        if prefix:
+            query = prefix_tsquery(term)
+            return Q(search_vector=SearchQuery(query, search_type='raw')) if query else Q(pk__in=[])
+        return Q(search_vector=SearchQuery(term, search_type='websearch'))
+
+    match = fts_match_expression(term, prefix)
+    if not match:
+        return Q(pk__in=[])
+    return Q(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+
+
+def match_posts(queryset, term):
+    """ Filter posts matching ``term`` through the search index, without ranking them """
+    return queryset.filter(match_condition(term, queryset.db))
+
+
+def search_posts(queryset, term):
+    """Filter posts matching ``term``, ranked by relevance
+
+    The returned queryset is annotated with ``rank`` (higher is better) and
+    ``headline`` (a content snippet with the matches highlighted).
+    """
+    if is_postgres(queryset.db):
+        query = SearchQuery(term, search_type='websearch')
+        return match_posts(queryset, term).annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                'content',
+                query,
+                start_sel=HEADLINE_START,
+                stop_sel=HEADLINE_STOP,
+                max_words=HEADLINE_WORDS * 2,
+                min_words=HEADLINE_WORDS,
+            ),
+        ).order_by('-rank', '-created_at', '-id')
+
+    match = fts_match_expression(term)
+    if not match:
+        return queryset.none()
+
+    table = queryset.model._meta.db_table
+    correlated = f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id'
+    return match_posts(queryset, term).annotate(
+        rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, %s, %s) {correlated}',
+            [FTS_TITLE_BM25_WEIGHT, FTS_CONTENT_BM25_WEIGHT, match],
+        ),
+        headline=RawSQL(
+            f"SELECT snippet({FTS_TABLE}, 1, %s, %s, '...', %s) {correlated}",
+            [HEADLINE_START, HEADLINE_STOP, HEADLINE_WORDS, match],
+        ),
+    ).order_by('-rank', '-created_at', '-id')
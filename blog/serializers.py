@@ -1,6 +1,8 @@
 from rest_framework import serializers
 from .models import Post, Category, Tag, Comment, Profile
-from core.serializers import DynamicFieldsModelSerializer, ProfileSerializer
+from core.instrumentation import TimedSerializerMixin
+from core.serializers import DynamicFieldsModelSerializer, ProfileSerializer, StorageURLField
+from .bulk import PreloadedPrimaryKeyRelatedField
 
 class CategorySerializer(DynamicFieldsModelSerializer):
     class Meta:
@@ -13,14 +15,32 @@ class TagSerializer(DynamicFieldsModelSerializer):
         fields = ['id', 'name', 'slug']
 
 class PostSerializer(DynamicFieldsModelSerializer):
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
     author = serializers.PrimaryKeyRelatedField(read_only=True)
     class Meta:
         model = Post
-        fields = ['id', 'title', 'content', 'author', 'categories', 'tags', 'created_at', 'updated_at']
+        fields = ['id', 'title', 'content', 'author', 'categories', 'tags', 'comment_count', 'created_at', 'updated_at']
+
+class PostSearchSerializer(PostSerializer):
+    rank = serializers.FloatField(read_only=True)
+    headline = serializers.CharField(read_only=True)
+
+    class Meta(PostSerializer.Meta):
+        fields = PostSerializer.Meta.fields + ['rank', 'headline']
 
 class CommentSerializer(DynamicFieldsModelSerializer):
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
     author = ProfileSerializer(read_only=True)
 
     class Meta:
         model = Comment
         fields = ['id', 'post', 'author', 'content', 'created_at']
+
+class PostCommentSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """ Comment with its author flattened into a few columns of the same row """
+    author_username = serializers.CharField(source='author.user.username', read_only=True)
+    author_profile_picture = StorageURLField(source='author.profile_picture')
+
+    class Meta:
+        model = Comment
+        fields = ['id', 'post', 'author', 'author_username', 'author_profile_picture', 'content', 'created_at']
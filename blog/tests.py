@@ -1,3 +1,764 @@
-from django.test import TestCase
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rest_framework.test import APITestCase
+
+from core.models import Profile
+from core.tests import QueryBudgetMixin
+from .export import ExportView
+from .management.commands import seed_blog
+from .pagination import EstimatedCountPaginator
+from .models import Post, Category, Tag, Comment
+
+
+class BlogQueryBudgetTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='john', password='secret-pass-123')
+        cls.profile = cls.user.profile
+        cls.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(3)]
+        cls.tags = [Tag.objects.create(name=f'Tag {i}', slug=f'tag-{i}') for i in range(3)]
+        for i in range(20):
+            post = Post.objects.create(title=f'Post {i}', content='Lorem ipsum', author=cls.profile)
+            post.categories.set(cls.categories)
+            post.tags.set(cls.tags)
+            Comment.objects.create(post=post, author=cls.profile, content=f'Comment {i}')
+
+    def test_post_list(self):
+        url = reverse('blog:post-list')
+        small = self.assertQueryBudget(5, 'get', url, data={'limit': 1})
+        large = self.assertQueryBudget(5, 'get', url, data={'limit': 20})
+        self.assertEqual(len(small.data['results']), 1)
+        self.assertEqual(len(large.data['results']), 20)
+        self.assertEqual(len(large.data['results'][0]['tags']), 3)
+
+    def test_post_detail(self):
+        post = Post.objects.first()
+        response = self.assertQueryBudget(4, 'get', reverse('blog:post-detail', args=[post.pk]))
+        self.assertEqual(len(response.data['categories']), 3)
+
+    def test_post_update(self):
+        self.client.force_authenticate(self.user)
+        post = Post.objects.first()
+        response = self.assertQueryBudget(
+            10, 'patch', reverse('blog:post-detail', args=[post.pk]), data={'title': 'Edited'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_list(self):
+        url = reverse('blog:comment-list')
+        self.assertQueryBudget(3, 'get', url, data={'limit': 1})
+        response = self.assertQueryBudget(3, 'get', url, data={'limit': 20})
+        self.assertEqual(len(response.data['results']), 20)
+
+    def test_post_reads_skip_the_search_vector(self):
+        post = Post.objects.first()
+        urls = [
+            reverse('blog:post-list'), reverse('blog:post-detail', args=[post.pk]),
+            reverse('blog-async:post-list'), reverse('blog-async:post-detail', args=[post.pk]),
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertNotIn('search_vector', ' '.join(query['sql'] for query in ctx.captured_queries), url)
+
+    def test_category_and_tag_list(self):
+        self.assertQueryBudget(2, 'get', reverse('blog:category-list'))
+        self.assertQueryBudget(2, 'get', reverse('blog:tag-list'))
+
+
+class KeysetPaginationTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='john', password='secret-pass-123')
+        for i in range(12):
+            post = Post.objects.create(title=f'Post {i}', content='Lorem ipsum', author=user.profile)
+            Comment.objects.create(post=post, author=user.profile, content=f'Comment {i}')
+
+    def walk(self, url, budget):
+        ids = []
+        response = self.assertQueryBudget(budget, 'get', url, data={'cursor': '', 'limit': 5})
+        while True:
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            if response.data['next'] is None:
+                return ids, response
+            response = self.assertQueryBudget(budget, 'get', response.data['next'])
+
+    def test_cursor_walk_matches_offset_order(self):
+        for name, model, budget in (('blog:post-list', Post, 4), ('blog:comment-list', Comment, 2)):
+            ids, last = self.walk(reverse(name), budget)
+            expected = list(model.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+            self.assertEqual(ids, expected)
+
+            previous = self.client.get(last.data['previous'])
+            self.assertEqual([item['id'] for item in previous.data['results']], expected[5:10])
+
+    def test_offset_pagination_is_default(self):
+        response = self.client.get(reverse('blog:post-list'))
+        self.assertEqual(response.data['count'], 12)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('blog:post-list'), data={'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PostSearchTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        profile = User.objects.create_user(username='john', password='secret-pass-123').profile
+        cls.in_title = Post.objects.create(title='Tuning databases', content='Indexes matter.', author=profile)
+        cls.in_content = Post.objects.create(title='Weekly notes', content='We spent the week tuning queries.', author=profile)
+        Post.objects.create(title='Gardening', content='Tomatoes and basil.', author=profile)
+
+    def search(self, term):
+        return self.client.get(reverse('blog:post-list'), data={'search': term})
+
+    def test_title_matches_rank_first(self):
+        response = self.search('tuning')
+        results = response.data['results']
+        self.assertEqual([post['id'] for post in results], [self.in_title.id, self.in_content.id])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertIn('<b>tuning</b>', results[1]['headline'])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.in_content.content = 'Nothing to see here.'
+        self.in_content.save()
+        self.assertEqual(self.search('tuning').data['count'], 1)
+
+        self.in_title.delete()
+        self.assertEqual(self.search('tuning').data['count'], 0)
+
+    def test_query_syntax_is_escaped(self):
+        response = self.search('"tuning OR NEAR(')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 0)
+
+
+@override_settings(TAXONOMY_CACHE_ENABLED=True)
+class TaxonomyCacheTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Django', slug='django')
+
+    def test_warm_requests_run_no_queries(self):
+        for url in (reverse('blog:category-list'), reverse('blog:category-detail', args=[self.category.pk])):
+            cold = self.client.get(url)
+            warm = self.assertQueryBudget(0, 'get', url)
+            self.assertEqual(warm.data, cold.data)
+
+    @override_settings(TAXONOMY_CACHE_ENABLED=False)
+    def test_process_local_caches_are_not_used(self):
+        url = reverse('blog:category-list')
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+    def test_save_and_delete_invalidate(self):
+        url = reverse('blog:category-list')
+        self.client.get(url)
+
+        self.category.name = 'Python'
+        self.category.save()
+        self.assertEqual(self.client.get(url).data['results'][0]['name'], 'Python')
+
+        self.category.delete()
+        self.assertEqual(self.client.get(url).data['count'], 0)
+
+    def test_models_are_versioned_independently(self):
+        tag = Tag.objects.create(name='orm', slug='orm')
+        self.client.get(reverse('blog:category-list'))
+        tag.delete()
+        self.assertQueryBudget(0, 'get', reverse('blog:category-list'))
+
+
+class ConditionalGetTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        profile = User.objects.create_user(username='john', password='secret-pass-123').profile
+        cls.post = Post.objects.create(title='Post', content='Lorem ipsum', author=profile)
+
+    def test_matching_etag_returns_304_without_serializing(self):
+        # Lists run the page queries (count, page and prefetches), details one lookup
+        for url, budget in ((reverse('blog:post-list'), 4), (reverse('blog:post-detail', args=[self.post.pk]), 1)):
+            response = self.client.get(url)
+            self.assertTrue(response['ETag'].startswith('W/'))
+
+            with mock.patch('blog.serializers.PostSerializer.to_representation') as to_representation:
+                not_modified = self.assertQueryBudget(budget, 'get', url, HTTP_IF_NONE_MATCH=response['ETag'])
+            to_representation.assert_not_called()
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        # Only details can be dated by their own timestamp
+        self.assertNotIn('Last-Modified', self.client.get(reverse('blog:post-list')))
+        response = self.client.get(reverse('blog:post-detail', args=[self.post.pk]))
+        modified_since = self.client.get(response.wsgi_request.path, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(modified_since.status_code, 304)
+
+    def test_changes_invalidate_etag(self):
+        url = reverse('blog:post-list')
+        etag = self.client.get(url)['ETag']
+
+        self.post.title = 'Edited'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response['ETag']
+        Comment.objects.create(post=self.post, author=self.post.author, content='First')
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_validation_costs_the_page_query(self):
+        for i in range(3):
+            Post.objects.create(title=f'Post {i}', content='Lorem ipsum', author=self.post.author)
+        url = reverse('blog:post-list')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, data={'cursor': '', 'limit': 2})
+        # The page and its two prefetches, no aggregate over the table
+        self.assertEqual(len(ctx), 3)
+        self.assertFalse(any('COUNT(' in query['sql'] or 'MAX(' in query['sql'] for query in ctx.captured_queries))
+
+        # Edits of rows on other pages don't invalidate this one
+        Post.objects.filter(pk=self.post.pk).update(title='Edited', changed_at=timezone.now())
+        self.assertEqual(self.client.get(url, data={'cursor': '', 'limit': 2}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        next_page = self.client.get(response.data['next'])
+        Post.objects.filter(pk=next_page.data['results'][0]['id']).update(changed_at=timezone.now())
+        self.assertEqual(self.client.get(response.data['next'], HTTP_IF_NONE_MATCH=next_page['ETag']).status_code, 200)
+
+    def test_deleting_an_older_post_invalidates_the_list(self):
+        older = Post.objects.create(title='Older', content='Lorem ipsum', author=self.post.author)
+        Post.objects.filter(pk=older.pk).update(changed_at=self.post.changed_at - timedelta(days=1))
+        url = reverse('blog:post-list')
+        response = self.client.get(url)
+
+        older.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_profile_changes_invalidate_comment_etags(self):
+        comment = Comment.objects.create(post=self.post, author=self.post.author, content='First')
+        profile = self.post.author
+        for url in (reverse('blog:comment-list'), reverse('blog:comment-detail', args=[comment.pk])):
+            response = self.client.get(url)
+            self.assertNotIn('Last-Modified', response)
+
+            # Derived from the database, not from a per-process cache
+            cache.clear()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+            profile.bio = f'Bio for {url}'
+            profile.save()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 200)
+
+            profile.user.first_name = f'John {url}'
+            profile.user.save()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_comment_etags_follow_the_picture_url_window(self):
+        Comment.objects.create(post=self.post, author=self.post.author, content='First')
+        url = reverse('blog:comment-list')
+        with mock.patch('core.storage.time.time', return_value=0):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Presigned URLs are signed again in the next window
+        with mock.patch('core.storage.time.time', return_value=settings.PROFILE_PICTURE_URL_REFRESH):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_missing_post_still_404s(self):
+        self.assertEqual(self.client.get(reverse('blog:post-detail', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('blog:post-detail', args=['abc'])).status_code, 404)
+
+
+class PostCommentsTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='john', password='secret-pass-123')
+        cls.post = Post.objects.create(title='Popular', content='Lorem ipsum', author=cls.user.profile)
+        cls.quiet = Post.objects.create(title='Quiet', content='Lorem ipsum', author=cls.user.profile)
+        for i in range(30):
+            Comment.objects.create(post=cls.post, author=cls.user.profile, content=f'Comment {i}')
+
+    def test_comments_are_loaded_in_one_query(self):
+        url = reverse('blog:post-comments', args=[self.post.pk])
+        response = self.assertQueryBudget(1, 'get', url, data={'limit': 20})
+        results = response.data['results']
+        self.assertEqual(len(results), 20)
+        self.assertEqual(results[0]['author_username'], 'john')
+        self.assertEqual(results[0]['content'], 'Comment 29')
+
+        response = self.assertQueryBudget(1, 'get', response.data['next'])
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertIsNone(response.data['next'])
+
+    def test_empty_and_missing_posts(self):
+        response = self.client.get(reverse('blog:post-comments', args=[self.quiet.pk]))
+        self.assertEqual(response.data['results'], [])
+        self.assertEqual(self.client.get(reverse('blog:post-comments', args=[0])).status_code, 404)
+
+
+class PostCounterTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='john', password='secret-pass-123')
+        cls.busy = Post.objects.create(title='Busy', content='Lorem ipsum', author=cls.user.profile)
+        cls.quiet = Post.objects.create(title='Quiet', content='Lorem ipsum', author=cls.user.profile)
+
+    def comment(self, post):
+        return self.client.post(reverse('blog:comment-list'), data={'post': post.pk, 'content': 'Hi'})
+
+    def test_comment_count_follows_comment_api(self):
+        self.client.force_authenticate(self.user)
+        etag = self.client.get(reverse('blog:post-list'))['ETag']
+        updated_at, changed_at = self.busy.updated_at, self.busy.changed_at
+
+        first = self.comment(self.busy)
+        self.comment(self.busy)
+        self.busy.refresh_from_db()
+        self.assertEqual(self.busy.comment_count, 2)
+        # Comments don't make the post itself look edited
+        self.assertEqual(self.busy.updated_at, updated_at)
+        self.assertGreater(self.busy.changed_at, changed_at)
+        self.assertEqual(
+            self.client.get(reverse('blog:post-list'), HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+        self.client.patch(reverse('blog:comment-detail', args=[first.data['id']]), data={'post': self.quiet.pk})
+        self.client.delete(reverse('blog:comment-detail', args=[first.data['id']]))
+        self.busy.refresh_from_db()
+        self.quiet.refresh_from_db()
+        self.assertEqual((self.busy.comment_count, self.quiet.comment_count), (1, 0))
+
+    def test_moving_counts_between_posts_invalidates_etags(self):
+        comment = Comment.objects.create(post=self.busy, author=self.user.profile, content='Hi')
+        url = reverse('blog:post-list')
+        etag = self.client.get(url)['ETag']
+
+        # Same number of posts and the same sum of counts
+        comment.delete()
+        Comment.objects.create(post=self.quiet, author=self.user.profile, content='Hi')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_queryset_delete_keeps_counts(self):
+        for post in (self.busy, self.busy, self.quiet):
+            Comment.objects.create(post=post, author=self.user.profile, content='Hi')
+        Comment.objects.filter(post=self.busy).delete()
+        self.assertEqual(
+            dict(Post.objects.values_list('title', 'comment_count')), {'Busy': 0, 'Quiet': 1}
+        )
+
+    def test_deleting_a_post_does_not_load_its_comments(self):
+        def delete_queries(comments):
+            post = Post.objects.create(title='Doomed', content='Lorem ipsum', author=self.user.profile)
+            Comment.objects.bulk_create(
+                [Comment(post=post, author=self.user.profile, content='Hi') for _ in range(comments)]
+            )
+            with CaptureQueriesContext(connection) as ctx:
+                post.delete()
+            return len(ctx)
+
+        self.assertEqual(delete_queries(2), delete_queries(20))
+        self.assertFalse(Comment.objects.filter(post__title='Doomed').exists())
+
+    def test_ordering_by_comment_count(self):
+        Comment.objects.create(post=self.quiet, author=self.user.profile, content='Hi')
+        response = self.client.get(reverse('blog:post-list'), data={'ordering': '-comment_count'})
+        self.assertEqual(response.data['results'][0]['id'], self.quiet.pk)
+        self.assertEqual(response.data['results'][0]['comment_count'], 1)
+
+    def test_rebuild_command_repairs_drift(self):
+        Comment.objects.create(post=self.busy, author=self.user.profile, content='Hi')
+        Post.objects.update(comment_count=7)
+        stdout = StringIO()
+        call_command('rebuild_post_counters', batch_size=1, stdout=stdout)
+        self.assertEqual(
+            dict(Post.objects.values_list('title', 'comment_count')), {'Busy': 1, 'Quiet': 0}
+        )
+        self.assertEqual(stdout.getvalue().count('Repaired counters of 2 posts'), 1)
+
+
+class SparseFieldsetTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        profile = User.objects.create_user(username='john', password='secret-pass-123').profile
+        tag = Tag.objects.create(name='orm', slug='orm')
+        for i in range(3):
+            post = Post.objects.create(title=f'Post {i}', content='Lorem ipsum', author=profile)
+            post.tags.add(tag)
+            Comment.objects.create(post=post, author=profile, content='Hi')
+
+    def test_fields_are_pushed_into_the_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('blog:post-list'), data={'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        # COUNT(*) and the rows; no M2M prefetches
+        self.assertEqual(len(ctx), 2)
+        self.assertNotIn('"content"', ctx.captured_queries[-1]['sql'])
+
+    def test_exclude_keeps_needed_prefetches(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('blog:post-list'), data={'exclude': 'content,categories'})
+        post = response.data['results'][0]
+        self.assertNotIn('content', post)
+        self.assertEqual(len(post['tags']), 1)
+        self.assertEqual(len(ctx), 3)
+
+    def test_comment_author_join_is_dropped(self):
+        response = self.assertQueryBudget(3, 'get', reverse('blog:comment-list'), data={'fields': 'id,content'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'content'})
+
+        response = self.assertQueryBudget(3, 'get', reverse('blog:comment-list'), data={'fields': 'id,author'})
+        self.assertIn('bio', response.data['results'][0]['author'])
+
+    def test_fields_are_ignored_on_writes(self):
+        user = User.objects.get(username='john')
+        category = Category.objects.create(name='Django', slug='django')
+        self.client.force_authenticate(user)
+        response = self.client.post(
+            reverse('blog:post-list') + '?fields=id',
+            data={'title': 'New', 'content': 'Body', 'categories': [category.pk], 'tags': [Tag.objects.get().pk]}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('content', response.data)
+
+
+class BulkCreateTests(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='john', password='secret-pass-123')
+        cls.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(3)]
+        cls.tags = [Tag.objects.create(name=f'Tag {i}', slug=f'tag-{i}') for i in range(3)]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def posts(self, count):
+        return [{
+            'title': f'Imported {i}',
+            'content': f'Imported body {i}',
+            'categories': [category.pk for category in self.categories],
+            'tags': [self.tags[i % 3].pk],
+        } for i in range(count)]
+
+    def test_posts_are_inserted_in_a_fixed_number_of_queries(self):
+        url = reverse('blog:post-bulk-create')
+        # Preload categories and tags, insert posts and two through tables, index for search
+        small = self.assertQueryBudget(8, 'post', url, data=self.posts(2), format='json')
+        large = self.assertQueryBudget(8, 'post', url, data=self.posts(50), format='json')
+        self.assertEqual((small.status_code, large.status_code), (201, 201))
+        self.assertEqual(large.data['created'], 50)
+
+        post = Post.objects.get(pk=large.data['ids'][4])
+        self.assertEqual(post.author, self.user.profile)
+        self.assertEqual(post.categories.count(), 3)
+        self.assertEqual(list(post.tags.all()), [self.tags[1]])
+        self.assertEqual(self.client.get(reverse('blog:post-list'), data={'search': 'Imported'}).data['count'], 52)
+
+    def test_errors_are_reported_per_item_and_nothing_is_written(self):
+        items = self.posts(3)
+        items[1]['tags'] = [0]
+        del items[2]['title']
+        response = self.client.post(reverse('blog:post-bulk-create'), data=items, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertIn('tags', response.data['errors'][0]['errors'])
+        self.assertFalse(Post.objects.exists())
+
+    def test_comments_update_post_counters(self):
+        posts = [Post.objects.create(title=f'Post {i}', content='Lorem', author=self.user.profile) for i in range(2)]
+        items = [{'post': posts[i % 2].pk, 'content': f'Comment {i}'} for i in range(5)]
+
+        response = self.assertQueryBudget(6, 'post', reverse('blog:comment-bulk-create'), data=items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(Post.objects.values_list('comment_count', flat=True)), [2, 3]
+        )
+
+
+class AsyncReadPathTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='john', password='secret-pass-123')
+        category = Category.objects.create(name='News', slug='news')
+        tag = Tag.objects.create(name='Django', slug='django')
+        for i in range(8):
+            post = Post.objects.create(title=f'Post {i}', content='Lorem ipsum', author=cls.user.profile)
+            post.categories.set([category])
+            post.tags.set([tag])
+            Comment.objects.create(post=post, author=cls.user.profile, content=f'Comment {i}')
+        cls.post = post
+
+    def assertSameResponse(self, name, args=(), data=None):
+        """ The async endpoint answers like the DRF one, links aside """
+        expected = self.client.get(reverse(f'blog:{name}', args=args), data=data)
+        response = self.client.get(reverse(f'blog-async:{name}', args=args), data=data)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(
+            json.loads(response.content.decode().replace('/api/v1/async/', '/api/v1/')),
+            json.loads(expected.content)
+        )
+        return response.json()
+
+    def test_responses_match_the_drf_viewsets(self):
+        page = self.assertSameResponse('post-list', data={'limit': 3, 'offset': 2})
+        self.assertEqual(page['count'], 8)
+        page = self.assertSameResponse('post-list', data={'limit': 3, 'cursor': ''})
+        self.assertSameResponse('post-list', data={'limit': 3, 'cursor': page['next'].split('cursor=')[1]})
+        self.assertSameResponse('post-detail', args=[self.post.pk])
+        self.assertSameResponse('post-comments', args=[self.post.pk])
+        self.assertSameResponse('category-list')
+        self.assertSameResponse('tag-detail', args=[Tag.objects.get().pk])
+
+    def test_missing_objects(self):
+        self.assertSameResponse('post-detail', args=[0])
+        self.assertSameResponse('post-comments', args=[0])
+        self.assertSameResponse('post-list', data={'cursor': 'garbage'})
+
+    def test_serialization_does_not_query(self):
+        # Queries left lazy would raise SynchronousOnlyOperation in the event loop
+        response = self.client.get(reverse('blog-async:post-list'))
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertEqual(response.json()['results'][0]['categories'], [Category.objects.get().pk])
+
+
+class SeedBlogCommandTests(APITestCase):
+
+    def seed(self, **options):
+        options = {'users': 6, 'posts': 40, 'comments': 200, 'categories': 4, 'tags': 8, 'batch_size': 15, **options}
+        call_command('seed_blog', stdout=StringIO(), **options)
+
+    def test_generates_consistent_data(self):
+        self.seed()
+
+        self.assertEqual(User.objects.count(), 6)
+        self.assertEqual(Profile.objects.count(), 6)
+        self.assertEqual((Post.objects.count(), Comment.objects.count()), (40, 200))
+        self.assertFalse(Post.objects.filter(categories=None).exists())
+        self.assertFalse(Post.objects.filter(tags=None).exists())
+        self.assertTrue(all(
+            post.comment_count == post.comments.count() for post in Post.objects.all()
+        ))
+        self.assertFalse(Comment.objects.filter(created_at__lt=F('post__created_at')).exists())
+        # Counted while seeding, no recount touching every post afterwards
+        self.assertFalse(Post.objects.exclude(changed_at=F('created_at')).exists())
+
+        # Comments are skewed towards a few popular posts
+        counts = sorted(Post.objects.values_list('comment_count', flat=True), reverse=True)
+        self.assertGreater(sum(counts[:4]), sum(counts) / 3)
+
+        # Seeded users can log in and the rows are searchable and servable
+        response = self.client.post(reverse('accounts:login'), data={'username': 'seed1', 'password': 'seed-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        word = Post.objects.first().title.split()[0]
+        self.assertGreater(self.client.get(reverse('blog:post-list'), data={'search': word}).data['count'], 0)
+
+    def test_copy_columns_cover_every_not_null_field(self):
+        for model, columns in ((Post, seed_blog.POST_COLUMNS), (Comment, seed_blog.COMMENT_COLUMNS)):
+            required = {field.attname for field in model._meta.concrete_fields if not field.null}
+            self.assertEqual(required - set(columns), set(), model.__name__)
+
+    def test_same_seed_generates_the_same_data(self):
+        self.seed(seed=7)
+        first = list(Post.objects.order_by('pk').values_list('title', 'comment_count'))
+        Post.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(seed=7)
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('title', 'comment_count')), first)
+
+
+class ExportTests(APITestCase):
+    databases = {'default', 'replica'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='admin', password='secret-pass-123', is_staff=True)
+        profile = cls.admin.profile
+        cls.categories = [Category.objects.create(name=f'Category {i}', slug=f'category-{i}') for i in range(2)]
+        cls.tag = Tag.objects.create(name='Tag', slug='tag')
+        cls.posts = [Post.objects.create(title=f'Post {i}', content='Lorem ipsum', author=profile) for i in range(5)]
+        cls.posts[0].categories.set(cls.categories)
+        cls.posts[0].tags.set([cls.tag])
+        for post in cls.posts[:2]:
+            Comment.objects.create(post=post, author=profile, content='Nice')
+
+    def export(self, **params):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('blog:export'), data=params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_streams_posts_and_comments(self):
+        # Small chunks exercise the per-chunk category and tag queries
+        with mock.patch.object(ExportView, 'chunk_size', 2):
+            header, *rows = self.export()
+
+        self.assertEqual(header['types'], ['posts', 'comments'])
+        posts = [row for row in rows if row['type'] == 'post']
+        comments = [row for row in rows if row['type'] == 'comment']
+        self.assertEqual([post['id'] for post in posts], [post.pk for post in self.posts])
+        self.assertEqual(posts[0]['categories'], [category.pk for category in self.categories])
+        self.assertEqual((posts[0]['tags'], posts[1]['categories']), ([self.tag.pk], []))
+        self.assertEqual(posts[0]['comment_count'], 1)
+        self.assertEqual([comment['post'] for comment in comments], [post.pk for post in self.posts[:2]])
+
+    @override_settings(EXPORT_SINCE_OVERLAP=0)
+    def test_since_only_exports_later_changes(self):
+        next_since = self.export()[0]['next_since']
+        post = self.posts[3]
+        post.title = 'Edited'
+        post.save()
+
+        header, *rows = self.export(since=next_since)
+        self.assertEqual([(row['type'], row['id'], row['title']) for row in rows], [('post', post.pk, 'Edited')])
+
+    def test_next_since_overlaps_the_previous_export(self):
+        # Saved just before the export started, but possibly committed after it
+        Post.objects.filter(pk=self.posts[3].pk).update(changed_at=timezone.now() - timedelta(seconds=30))
+        header = self.export()[0]
+        self.assertEqual(parse_datetime(header['started_at']) - parse_datetime(header['next_since']), timedelta(minutes=5))
+
+        header, *rows = self.export(since=header['next_since'])
+        self.assertIn(('post', self.posts[3].pk), [(row['type'], row['id']) for row in rows])
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_reads_from_the_primary(self):
+        cache.clear()
+        # Rows only exist on the primary here
+        header, *rows = self.export(types='posts')
+        self.assertEqual(len(rows), len(self.posts))
+
+    def test_requires_admin_and_valid_parameters(self):
+        self.assertEqual(self.client.get(reverse('blog:export')).status_code, 401)
+        self.client.force_authenticate(self.admin)
+        self.assertEqual(self.client.get(reverse('blog:export'), data={'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('blog:export'), data={'types': 'users'}).status_code, 400)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_blog', types='comments', chunk_size=1, stdout=out)
+        header, *rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(header['types'], ['comments'])
+        self.assertEqual([row['type'] for row in rows], ['comment', 'comment'])
+
+
+class AdminChangelistTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', password='secret-pass-123')
+        cls.category = Category.objects.create(name='Python', slug='python')
+        cls.post = Post.objects.create(title='Django admin at scale', content='Lorem ipsum', author=cls.admin.profile)
+        cls.post.categories.set([cls.category])
+        Comment.objects.create(post=cls.post, author=cls.admin.profile, content='Nice')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        user = User.objects.create_user(username=f'author{count}', password='secret-pass-123')
+        posts = Post.objects.bulk_create(
+            [Post(title=f'Post {i}', content='Lorem ipsum', author=user.profile) for i in range(count)]
+        )
+        Comment.objects.bulk_create(
+            [Comment(post=post, author=user.profile, content='Nice') for post in posts]
+        )
+
+    def changelist_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, data=params)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [
+            reverse('admin:blog_post_changelist'),
+            reverse('admin:blog_comment_changelist'),
+            reverse('admin:core_profile_changelist'),
+        ]
+        before = [self.changelist_queries(url) for url in urls]
+        self.add_rows(30)
+        self.assertEqual([self.changelist_queries(url) for url in urls], before)
+
+        # Filtered lists load the one selected object only
+        url = reverse('admin:blog_comment_changelist')
+        filtered = self.changelist_queries(url, post__id__exact=self.post.pk)
+        self.add_rows(10)
+        self.assertEqual(self.changelist_queries(url, post__id__exact=self.post.pk), filtered)
+
+    def test_post_changelist_skips_large_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('admin:blog_post_changelist'))
+        sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('search_vector', sql)
+        self.assertNotIn('"blog_post"."content"', sql)
+
+        # The change form still shows and saves the content
+        response = self.client.get(reverse('admin:blog_post_change', args=[self.post.pk]))
+        self.assertContains(response, 'Lorem ipsum')
+
+    def test_autocomplete_filters(self):
+        response = self.client.get(reverse('admin:blog_post_changelist'), data={'categories__id__exact': self.category.pk})
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, f'<option value="{self.category.pk}" selected>Python</option>', html=True)
+        self.assertContains(response, 'autocomplete.js')
+        self.assertEqual(list(response.context['cl'].result_list), [self.post])
+
+        # Posts are looked up through the search index
+        response = self.client.get(reverse('admin:autocomplete'), data={
+            'app_label': 'blog', 'model_name': 'comment', 'field_name': 'post', 'term': 'admin',
+        })
+        self.assertEqual([result['id'] for result in response.json()['results']], [str(self.post.pk)])
+
+        # Partial words match while typing
+        response = self.client.get(reverse('admin:autocomplete'), data={
+            'app_label': 'blog', 'model_name': 'comment', 'field_name': 'post', 'term': 'djan adm',
+        })
+        self.assertEqual([result['id'] for result in response.json()['results']], [str(self.post.pk)])
+
+    def test_search(self):
+        self.add_rows(3)
+        url = reverse('admin:blog_post_changelist')
+        self.assertEqual(list(self.client.get(url, data={'q': 'scale'}).context['cl'].result_list), [self.post])
+        self.assertEqual(len(self.client.get(url, data={'q': 'author3'}).context['cl'].result_list), 3)
+
+    def test_comment_str_with_related_objects_loaded(self):
+        comment = Comment.objects.select_related('post', 'author__user').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(comment), 'Comment by admin on Django admin at scale')
+
+    def test_estimated_count(self):
+        queryset = Post.objects.order_by('pk')
+        plan = json.dumps([{'Plan': {'Plan Rows': 2000000}}])
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(type(queryset), 'explain', return_value=plan):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 2000000)
+            with self.settings(ADMIN_EXACT_COUNT_LIMIT=5000000):
+                self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 1)
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .export import ExportView
 from .viewsets import PostViewSet, CategoryViewSet, TagViewSet, CommentViewSet
 
 app_name = 'blog'
@@ -11,5 +12,6 @@ router.register(r'tags', TagViewSet)
 router.register(r'comments', CommentViewSet)
 
 urlpatterns = [
+    path('export/', ExportView.as_view(), name='export'),
     path('', include(router.urls)),
 ]
@@ -1,50 +1,121 @@
+from collections import Counter
+
 from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404
 
 from rest_framework import viewsets, permissions, filters
+from rest_framework.decorators import action
 
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Post, Category, Tag, Comment
-from .serializers import PostSerializer, CategorySerializer, TagSerializer, CommentSerializer
+from . import search
+from .bulk import BulkCreateMixin
+from .cache import VersionedCacheMixin
+from .conditional import ConditionalGetMixin
+from .fieldsets import SparseFieldsetMixin
+from .filters import PostSearchFilter
+from .models import Post, Category, Tag, Comment, adjust_comment_counts
+from .pagination import KeysetPagination, KeysetOnlyPagination
+from .serializers import (
+    PostSerializer, PostSearchSerializer, CategorySerializer, TagSerializer, CommentSerializer, PostCommentSerializer
+)
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all().order_by('-created_at')
+class PostViewSet(ConditionalGetMixin, SparseFieldsetMixin, BulkCreateMixin, viewsets.ModelViewSet):
+    # search_vector is as large as the content and never serialized
+    queryset = Post.objects.defer('search_vector').prefetch_related('categories', 'tags').order_by('-created_at', '-id')
     serializer_class = PostSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend]
-    search_fields = ['title', 'content']
+    filter_backends = [PostSearchFilter, DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['categories', 'tags']
+    ordering_fields = ['created_at', 'updated_at', 'comment_count']
+    # Read by the pagination and the ETag
+    sparse_required_fields = ['id', 'created_at', 'changed_at']
+    # Also moves when the comment count does
+    last_modified_field = 'changed_at'
+
+    def get_serializer_class(self):
+        if self.action == 'list' and PostSearchFilter().get_search_term(self.request):
+            return PostSearchSerializer
+        return super().get_serializer_class()
+
+    @action(detail=True, methods=['get'], url_path='comments')
+    def comments(self, request, pk=None):
+        """ Comments of a single post, newest first, paginated by cursor """
+        queryset = Comment.objects.filter(post_id=pk).select_related('author__user').only(
+            'id', 'post_id', 'content', 'created_at',
+            'author__id', 'author__profile_picture', 'author__user__username',
+        )
+        paginator = KeysetOnlyPagination()
+        try:
+            page = paginator.paginate_queryset(queryset, request, view=self)
+        except (TypeError, ValueError):
+            raise Http404
+
+        # Only an empty first page needs to tell a missing post from a quiet one
+        if not page and not Post.objects.filter(pk=pk).exists():
+            raise Http404
+
+        serializer = PostCommentSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.profile)
 
+    def get_bulk_extra_fields(self):
+        return {'author': self.request.user.profile}
+
+    def after_bulk_create(self, instances):
+        search.index_posts(instances)
+
     def perform_update(self, serializer):
-        if serializer.instance.author != self.request.user.profile:
+        if serializer.instance.author_id != self.request.user.profile.id:
             raise PermissionDenied('You do not have permission to edit this post.')
         super().perform_update(serializer)
 
     def perform_destroy(self, instance):
-        if instance.author != self.request.user.profile:
+        if instance.author_id != self.request.user.profile.id:
             raise PermissionDenied('You do not have permission to delete this post.')
         super().perform_destroy(instance)
 
-class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all().order_by('-created_at')
+class CommentViewSet(ConditionalGetMixin, SparseFieldsetMixin, BulkCreateMixin, viewsets.ModelViewSet):
+    queryset = Comment.objects.select_related('author__user').order_by('-created_at', '-id')
     serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # Read by the pagination and the ETag
+    sparse_required_fields = ['id', 'created_at', 'updated_at']
+    # Comments render their author's profile and picture URL
+    related_modified_fields = ['author__updated_at']
+    etag_picture_urls = True
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user.profile)
 
+    def get_bulk_extra_fields(self):
+        return {'author': self.request.user.profile}
+
+    def after_bulk_create(self, instances):
+        # One UPDATE for every post that got new comments
+        adjust_comment_counts(Counter(comment.post_id for comment in instances))
+
+    def perform_update(self, serializer):
+        previous_post_id = serializer.instance.post_id
+        with transaction.atomic():
+            super().perform_update(serializer)
+            if serializer.instance.post_id != previous_post_id:
+                adjust_comment_counts({previous_post_id: -1, serializer.instance.post_id: 1})
+
     def perform_destroy(self, instance):
-        if instance.author != self.request.user.profile:
+        if instance.author_id != self.request.user.profile.id:
             raise PermissionDenied('You do not have permission to delete this comment.')
         super().perform_destroy(instance)
 
-class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
+class CategoryViewSet(VersionedCacheMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedCacheMixin, SparseFieldsetMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
@@ -49,7 +49,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.InstrumentationMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -97,13 +100,155 @@ DATABASES = {
         'PASSWORD': os.getenv("POSTGRES_PASSWORD"),
         'HOST': os.getenv("POSTGRES_HOST"),
         'PORT': os.getenv("POSTGRES_PORT"),
+        # Reuse connections across requests, checked before each reuse
+        'CONN_MAX_AGE': int(os.getenv('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DATABASE_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
     }
 }
 
+# Optional psycopg_pool connection pool, used instead of persistent connections
+if os.getenv('DATABASE_POOL_MAX_SIZE') is not None:
+    DATABASES['default'].update({
+        'ENGINE': 'core.db.postgresql',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE')),
+                'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 10)),
+                'max_lifetime': float(os.getenv('DATABASE_POOL_MAX_LIFETIME', 30 * 60)),
+                'max_idle': float(os.getenv('DATABASE_POOL_MAX_IDLE', 10 * 60)),
+            },
+        },
+    })
+
+# Read replicas, one alias per POSTGRES_REPLICA_HOSTS entry ("host" or
+# "host:port"). Safe requests read from them, see core.middleware.ReplicaMiddleware
+DATABASE_REPLICAS = []
+for index, address in enumerate(filter(None, os.getenv('POSTGRES_REPLICA_HOSTS', '').split(','))):
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{index + 1}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica_{index + 1}')
+
+if os.getenv('DATABASE_ENGINE') == 'sqlite':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+        },
+        # Only read from when listed in DATABASE_REPLICAS, e.g. by the router tests
+        "replica": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.replica.sqlite3",
+        },
+    }
+    DATABASE_REPLICAS = []
+
+DATABASE_ROUTERS = ['core.db.routers.ReplicaRouter']
+# 'round_robin' or 'least_latency'
+DATABASE_REPLICA_STRATEGY = os.getenv('DATABASE_REPLICA_STRATEGY', 'round_robin')
+# How long a client's reads stay on the primary after it writes
+DATABASE_STICKY_SECONDS = int(os.getenv('DATABASE_STICKY_SECONDS', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Share the cache between worker processes when Redis is available
+if os.getenv('REDIS_URL') is not None:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv('REDIS_URL'),
+        }
+    }
+
+TAXONOMY_CACHE_TIMEOUT = int(os.getenv('TAXONOMY_CACHE_TIMEOUT', 60 * 60))
+# Cached category and tag responses are invalidated through version keys in
+# the cache, which only reach every worker process when the cache is shared;
+# on by default with Redis only, turn it on for single-process deployments
+TAXONOMY_CACHE_ENABLED = os.getenv(
+    'TAXONOMY_CACHE_ENABLED', str(os.getenv('REDIS_URL') is not None)
+).lower() == 'true'
+
+# Admin changelists show the planner's row estimate above this many rows,
+# see blog.pagination.EstimatedCountPaginator
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv('ADMIN_EXACT_COUNT_LIMIT', 10000))
+
+# The next_since of an export is this many seconds before it started, so rows
+# committed late are exported again rather than missed, see blog.export
+EXPORT_SINCE_OVERLAP = int(os.getenv('EXPORT_SINCE_OVERLAP', 5 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
+# Per-request instrumentation, see core.middleware.InstrumentationMiddleware
+REQUEST_SLOW_MS = int(os.getenv('REQUEST_SLOW_MS', 500))
+REQUEST_PROFILE_RATE = float(os.getenv('REQUEST_PROFILE_RATE', 0))
+REQUEST_PROFILE_DIR = os.getenv('REQUEST_PROFILE_DIR', BASE_DIR / 'profiles')
+
+# Response compression, see core.middleware.CompressionMiddleware
+GZIP_MIN_SIZE = int(os.getenv('GZIP_MIN_SIZE', 1024))
+GZIP_CONTENT_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'text/javascript',
+)
+
+# Prometheus metrics at /metrics, see core.metrics. With several worker
+# processes point METRICS_DIR at a directory they share so any of them can
+# answer a scrape with the totals of all; run `manage.py clear_metrics`
+# before (re)starting the service. Scrapers send METRICS_TOKEN as a Bearer
+# token, without it only staff sessions can read the metrics
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# One JSON line per request on core.requests; slow requests are logged at
+# WARNING, set REQUEST_LOG_LEVEL=INFO to log every request
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'requests': {'class': 'logging.StreamHandler', 'formatter': 'message'},
+    },
+    'loggers': {
+        'core.requests': {
+            'handlers': ['requests'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+AUTHENTICATION_BACKENDS = [
+    'core.authentication.PooledModelBackend',
+]
+
+# Password hashing runs in a bounded pool per process; requests arriving
+# while every worker and queue slot is taken get a 429 right away
+PASSWORD_HASHER_WORKERS = int(os.getenv('PASSWORD_HASHER_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_HASHER_QUEUE_DEPTH = int(os.getenv('PASSWORD_HASHER_QUEUE_DEPTH', 16))
+PASSWORD_HASHER_RETRY_AFTER = int(os.getenv('PASSWORD_HASHER_RETRY_AFTER', 1))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -137,6 +282,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -147,11 +295,30 @@ if os.getenv('ALLOWED_HOSTS') is not None:
     ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS').split(',')
 
 
+# Largest batch accepted by the posts/bulk/ and comments/bulk/ endpoints
+BULK_CREATE_MAX_ITEMS = int(os.getenv('BULK_CREATE_MAX_ITEMS', 1000))
+
+# In-process cache of authenticated users and token blacklist lookups, entries
+# changed by another worker process are served stale for at most this long
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 30))
+AUTH_CACHE_MAX_SIZE = int(os.getenv('AUTH_CACHE_MAX_SIZE', 10000))
+
+
 REST_FRAMEWORK = {
+    # orjson when installed, the stdlib json otherwise; see core.renderers
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 5,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
@@ -175,6 +342,9 @@ SIMPLE_JWT = {
 
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
     'TOKEN_TYPE_CLAIM': 'token_type',
+
+    'TOKEN_REFRESH_SERIALIZER': 'core.authentication.CachedTokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'core.authentication.CachedTokenVerifySerializer',
 }
 
 
@@ -199,6 +369,14 @@ EMAIL_HOST_PASSWORD = 'vykenenssvwvxkth'
 EMAIL_USE_TLS = True
 EMAIL_PORT = '587'
 
+# Emails are queued in core.OutboxEmail and sent by `manage.py send_outbox_emails`
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_DELAY = 30
+EMAIL_OUTBOX_MAX_RETRY_DELAY = 60 * 60
+# Claimed emails not recorded as sent or failed by then are claimed again
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 10 * 60
+
 
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
@@ -208,6 +386,28 @@ LOGOUT_URL = '/api/v1/accounts/logout'
 
 BACKEND_URL = os.getenv('BACKEND_URL')
 
+
+# Profile pictures are staged locally and processed by `manage.py process_profile_pictures`
+PROFILE_PICTURE_STORAGE = os.getenv('PROFILE_PICTURE_STORAGE', 'core.storage.S3Storage')
+PROFILE_PICTURE_STAGING_DIR = os.getenv('PROFILE_PICTURE_STAGING_DIR', BASE_DIR / 'staging')
+PROFILE_PICTURE_THUMBNAIL_SIZES = (64, 128, 256)
+PROFILE_PICTURE_MAX_SIZE = int(os.getenv('PROFILE_PICTURE_MAX_SIZE', 10 * 1024 * 1024))
+# Uploads held by a worker this long are taken back by another one, at most
+# PROFILE_PICTURE_MAX_ATTEMPTS times
+PROFILE_PICTURE_CLAIM_TIMEOUT = int(os.getenv('PROFILE_PICTURE_CLAIM_TIMEOUT', 10 * 60))
+PROFILE_PICTURE_MAX_ATTEMPTS = int(os.getenv('PROFILE_PICTURE_MAX_ATTEMPTS', 3))
+
+# Multipart transfers to the object store
+S3_MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD', 8 * 1024 * 1024))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE', 8 * 1024 * 1024))
+S3_MAX_CONCURRENCY = int(os.getenv('S3_MAX_CONCURRENCY', 4))
+
+# Only object keys are stored; set PROFILE_PICTURE_PUBLIC_URL (CDN or public
+# bucket domain) to serve plain links instead of presigned URLs
+PROFILE_PICTURE_PUBLIC_URL = os.getenv('PROFILE_PICTURE_PUBLIC_URL')
+PROFILE_PICTURE_URL_EXPIRY = 604799 # week expiry
+PROFILE_PICTURE_URL_REFRESH = 60 * 60
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8000",
     "http://127.0.0.1:8000",
@@ -5,6 +5,9 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from core.api import DatabaseStatsView
+from core.views import MetricsView
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -21,11 +24,15 @@ urlpatterns = [
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('admin/', admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 blog_urlpatterns = [
     path('', include('blog.urls')),
+    # Native async read endpoints, for ASGI deployments
+    path('async/', include('blog.async_urls')),
     path('accounts/', include('core.urls')),
+    path('monitoring/database/', DatabaseStatsView.as_view(), name='database-stats'),
 ]
 
 api_urlpatterns = [
@@ -1,6 +1,7 @@
 from django.core.mail import send_mail
 from django.contrib.auth import logout 
 from django.contrib.auth.models import User
+from django.db import connections
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
@@ -9,15 +10,16 @@ from rest_framework import status, permissions, views
 from rest_framework.response import Response
 from rest_framework.generics import GenericAPIView
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 
-from . import serializers
+from . import hashing, serializers
 from .responses import DefaultResponse
 from .models import Profile
 from .helpers import send_password_reset_email
+from .uploads import MaxSizeUploadHandler
+from .authentication import CachedRefreshToken
 
 
 class RegesterationView(GenericAPIView):
@@ -52,7 +54,7 @@ class RegesterationView(GenericAPIView):
             }, status=status.HTTP_400_BAD_REQUEST)
 
         new_user = User(email=email, username=username, is_active=False)
-        new_user.set_password(password)
+        hashing.set_password(new_user, password)
         new_user.save()
 
         return DefaultResponse(
@@ -65,9 +67,14 @@ class ProfileAPIView(views.APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
+    def initialize_request(self, request, *args, **kwargs):
+        # Enforce the upload size limit while the multipart body is parsed
+        request.upload_handlers = [MaxSizeUploadHandler(request), *request.upload_handlers]
+        return super().initialize_request(request, *args, **kwargs)
+
     def get(self, request, *args, **kwargs):
         try:
-            profile = Profile.objects.get(user=request.user)
+            profile = Profile.objects.select_related('user').get(user=request.user)
         except Exception as _:
             return DefaultResponse(
             message="You have a problem with your profile please contact support",
@@ -168,7 +175,7 @@ class CustomLogoutView(views.APIView):
         refresh_token = request.data.get("refresh", None)
         if refresh_token:
             try:
-                token = RefreshToken(refresh_token)
+                token = CachedRefreshToken(refresh_token)
                 token.blacklist()
             except Exception as e:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
@@ -196,6 +203,7 @@ class PasswordResetView(GenericAPIView):
         token = PasswordResetTokenGenerator().make_token(user)
         uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
 
+        # Only queued in the outbox; the email worker sends it
         send_password_reset_email(user, uidb64, token)
 
         return DefaultResponse(
@@ -216,4 +224,26 @@ class PasswordResetConfirmView(GenericAPIView):
             message="Password has been reset successfully.",
             status=status.HTTP_200_OK,
             status_code=200
-        )
\ No newline at end of file
+        )
+
+class DatabaseStatsView(views.APIView):
+    """ Connection settings and pool usage of every database, for monitoring """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        databases = {}
+        for connection in connections.all():
+            pool_stats = getattr(connection, 'pool_stats', None)
+            databases[connection.alias] = {
+                'vendor': connection.vendor,
+                'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+                'conn_health_checks': connection.settings_dict['CONN_HEALTH_CHECKS'],
+                'pool': pool_stats() if pool_stats is not None else None,
+            }
+
+        return DefaultResponse(
+            message="Database stats retrieved successfully",
+            data={'databases': databases},
+            status=status.HTTP_200_OK,
+            status_code=200
+        )
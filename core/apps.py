@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Registers the auth cache invalidation receivers
+        from . import authentication  # noqa: F401
+        # Registers the query timer of every connection
+        from . import instrumentation  # noqa: F401
@@ -0,0 +1,207 @@
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import router
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import serializers
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer, TokenVerifySerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import hashing, metrics
+from .models import Profile
+
+
+class TTLCache:
+    """ Small thread-safe in-process cache whose entries expire after ``ttl`` seconds """
+
+    def __init__(self, name, ttl, max_size):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            metrics.CACHE_REQUESTS.inc(self.name, 'miss')
+            return default
+        metrics.CACHE_REQUESTS.inc(self.name, 'hit')
+        return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            if len(self._data) >= self.max_size:
+                self._evict()
+            self._data[key] = (time.monotonic() + self.ttl, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (expires, _) in self._data.items() if expires < now]:
+            del self._data[key]
+        # Still full: drop the oldest entries, dicts keep insertion order
+        for key in list(self._data)[:len(self._data) - self.max_size + 1]:
+            del self._data[key]
+
+
+# Entries are only dropped in the process that saw the change, other worker
+# processes may serve them until they expire, so keep the TTL short
+user_cache = TTLCache('auth_user', settings.AUTH_CACHE_TTL, settings.AUTH_CACHE_MAX_SIZE)
+blacklist_cache = TTLCache('auth_blacklist', settings.AUTH_CACHE_TTL, settings.AUTH_CACHE_MAX_SIZE)
+
+
+def snapshot(instance):
+    return tuple(getattr(instance, field.attname) for field in instance._meta.concrete_fields)
+
+
+def load_user(user_id):
+    """User with its profile, from the cache when possible
+
+    Only field values are cached; every call builds fresh instances, so a
+    request changing ``request.user`` never leaks into another one.
+    """
+    rows = user_cache.get(user_id)
+    if rows is None:
+        user = User.objects.select_related('profile').get(**{api_settings.USER_ID_FIELD: user_id})
+        try:
+            profile_row = snapshot(user.profile)
+        except Profile.DoesNotExist:
+            profile_row = None
+        rows = (snapshot(user), profile_row)
+        user_cache.set(user_id, rows)
+
+    user_row, profile_row = rows
+    user = User.from_db(router.db_for_read(User), None, user_row)
+    if profile_row is not None:
+        profile = Profile.from_db(router.db_for_read(Profile), None, profile_row)
+        user._state.fields_cache['profile'] = profile
+        profile._state.fields_cache['user'] = user
+    return user
+
+
+def is_blacklisted(jti):
+    blacklisted = blacklist_cache.get(jti)
+    if blacklisted is None:
+        blacklisted = BlacklistedToken.objects.filter(token__jti=jti).exists()
+        blacklist_cache.set(jti, blacklisted)
+    return blacklisted
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """ JWTAuthentication loading the user and profile through ``user_cache`` """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        try:
+            user = load_user(user_id)
+        except User.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class CachedRefreshToken(RefreshToken):
+    """ Refresh token checking the blacklist through ``blacklist_cache`` """
+
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
+
+
+class CachedTokenVerifySerializer(TokenVerifySerializer):
+
+    def validate(self, attrs):
+        token = UntypedToken(attrs["token"])
+
+        if (
+            api_settings.BLACKLIST_AFTER_ROTATION
+            and "rest_framework_simplejwt.token_blacklist" in settings.INSTALLED_APPS
+            and is_blacklisted(token.get(api_settings.JTI_CLAIM))
+        ):
+            raise serializers.ValidationError("Token is blacklisted")
+
+        return {}
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend checking passwords through the hasher pool
+
+    A saturated pool raises ``HasherBusy`` (a 429) for DRF requests; for
+    the others, such as the admin login form, it becomes a form error.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            return self.check_credentials(username, password)
+        except hashing.HasherBusy as e:
+            if isinstance(request, Request):
+                raise
+            raise ValidationError(e.detail, code=e.detail.code)
+
+    def check_credentials(self, username, password):
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Hash anyway, so unknown usernames take as long as wrong passwords
+            hashing.make_password(password)
+        else:
+            if hashing.check_password(user, password) and self.user_can_authenticate(user):
+                return user
+        return None
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.delete(getattr(instance, api_settings.USER_ID_FIELD))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    user_cache.delete(instance.user_id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def invalidate_blacklist_entry(sender, instance, **kwargs):
+    blacklist_cache.delete(instance.token.jti)
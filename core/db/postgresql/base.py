@@ -0,0 +1,91 @@
+"""PostgreSQL backend taking its connections from a ``psycopg_pool.ConnectionPool``
+
+Use ``'ENGINE': 'core.db.postgresql'`` and put the ``ConnectionPool``
+arguments (``min_size``, ``max_size``, ``timeout``, ``max_lifetime``, ...)
+under ``OPTIONS['pool']``. Without them it behaves exactly like the stock
+backend. Keep ``CONN_MAX_AGE`` at 0: closing a connection at the end of a
+request hands it back to the pool. ``CONN_HEALTH_CHECKS`` makes the pool
+check connections before handing them out.
+
+Django 5.1 ships the same feature; this backports it to Django 4.2.
+"""
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    # One pool per alias and process, shared by the per-thread wrappers. Keyed
+    # by database name too, the test runner renames the database in place.
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        pool_options = self.settings_dict['OPTIONS'].get('pool')
+        if not pool_options or self.alias == NO_DB_ALIAS:
+            return None
+
+        key = (self.alias, self.settings_dict['NAME'])
+        pool = self._pools.get(key)
+        if pool is None:
+            with self._pools_lock:
+                pool = self._pools.get(key)
+                if pool is None:
+                    pool = self._pools[key] = self.create_pool(pool_options)
+        return pool
+
+    def create_pool(self, pool_options):
+        try:
+            from psycopg_pool import ConnectionPool
+        except ImportError as e:
+            raise ImproperlyConfigured('Database pooling requires the psycopg_pool package.') from e
+
+        pool = ConnectionPool(
+            kwargs=self.get_connection_params(),
+            open=False,
+            check=ConnectionPool.check_connection if self.settings_dict['CONN_HEALTH_CHECKS'] else None,
+            name=self.alias,
+            **pool_options,
+        )
+        pool.open()
+        return pool
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        try:
+            self.isolation_level = IsolationLevel(isolation_level or IsolationLevel.READ_COMMITTED)
+        except ValueError:
+            raise ImproperlyConfigured(
+                f'Invalid transaction isolation level {isolation_level} '
+                f'specified. Use one of the psycopg.IsolationLevel values.'
+            )
+        connection = pool.getconn()
+        if isolation_level is not None:
+            connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if self.connection is None or pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # The pool rolls back anything left open before reusing it
+            pool.putconn(self.connection)
+
+    def pool_stats(self):
+        """ ``ConnectionPool.get_stats()``, None when pooling is off """
+        pool = self.pool
+        return pool.get_stats() if pool is not None else None
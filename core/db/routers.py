@@ -0,0 +1,81 @@
+import contextvars
+import itertools
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Alias safe requests read from, set by ReplicaMiddleware for the request
+read_alias = contextvars.ContextVar('read_alias', default=None)
+# Selector that picked it, told how long its queries take
+read_selector = contextvars.ContextVar('read_selector', default=None)
+
+
+class ReplicaRouter:
+    """Send reads to the replica picked for the current request
+
+    Outside of a request routed by ``ReplicaMiddleware`` everything uses the
+    primary. Writes always go to the primary, including saves of objects
+    loaded from a replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaSelector:
+    """Pick a replica for each request
+
+    ``round_robin`` cycles through the replicas. ``least_latency`` takes the
+    one with the lowest moving average query time, and every
+    ``probe_every``-th pick falls back to round robin so slow replicas get
+    measured again once they recover.
+    """
+
+    def __init__(self, aliases, strategy='round_robin', probe_every=20, smoothing=0.2):
+        if strategy not in ('round_robin', 'least_latency'):
+            raise ValueError(f'Unknown replica strategy {strategy!r}')
+        self.aliases = list(aliases)
+        self.strategy = strategy
+        self.probe_every = probe_every
+        self.smoothing = smoothing
+        self.latencies = {}
+        self._cycle = itertools.cycle(self.aliases)
+        self._picks = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def choose(self):
+        if not self.aliases:
+            return None
+        if self.strategy == 'round_robin' or next(self._picks) % self.probe_every == 0:
+            return next(self._cycle)
+        # Replicas not measured yet come first
+        return min(self.aliases, key=lambda alias: self.latencies.get(alias, 0.0))
+
+    def observe(self, alias, seconds):
+        """ Fold a query duration into the moving average of ``alias`` """
+        with self._lock:
+            previous = self.latencies.get(alias)
+            if previous is None:
+                self.latencies[alias] = seconds
+            else:
+                self.latencies[alias] = previous + self.smoothing * (seconds - previous)
+
+
+_selectors = {}
+
+
+def get_selector():
+    """ Selector for the configured replicas, rebuilt when the settings change """
+    key = (tuple(settings.DATABASE_REPLICAS), settings.DATABASE_REPLICA_STRATEGY)
+    selector = _selectors.get(key)
+    if selector is None:
+        selector = _selectors.setdefault(key, ReplicaSelector(*key))
+    return selector
@@ -0,0 +1,128 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import Throttled
+
+
+class HasherBusy(Throttled):
+    default_detail = _('Too many password operations in progress.')
+    default_code = 'hasher_busy'
+
+
+class HasherPool:
+    """Bounded thread pool running the password hashers
+
+    At most ``workers`` hashes run at once and ``queue_depth`` more may wait;
+    anything beyond that is refused right away with ``HasherBusy`` (a 429)
+    instead of tying up a request worker, so a burst of logins can't starve
+    the rest of the traffic. The hash functions release the GIL, so the pool
+    runs them in parallel.
+
+    Timings are kept per hasher algorithm, see ``stats``.
+    """
+
+    def __init__(self, workers, queue_depth, retry_after):
+        self.workers = workers
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @property
+    def executor(self):
+        # Created on first use, so forked server workers each get their own threads
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hasher')
+        return self._executor
+
+    def run(self, algorithm, func, *args):
+        """ Call ``func(*args)`` in the pool and wait for its result """
+        if not self._slots.acquire(blocking=False):
+            self.record(algorithm, rejected=True)
+            raise HasherBusy(wait=self.retry_after)
+
+        queued = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.record(algorithm, wait=started - queued, duration=time.perf_counter() - started)
+
+        try:
+            return self.executor.submit(timed).result()
+        finally:
+            self._slots.release()
+
+    def record(self, algorithm, wait=0.0, duration=None, rejected=False):
+        with self._lock:
+            stats = self._stats.setdefault(algorithm, {
+                'count': 0, 'rejected': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'wait_seconds': 0.0,
+            })
+            if rejected:
+                stats['rejected'] += 1
+                return
+            stats['count'] += 1
+            stats['seconds'] += duration
+            stats['max_seconds'] = max(stats['max_seconds'], duration)
+            stats['wait_seconds'] += wait
+
+    def stats(self):
+        """ ``{algorithm: {count, rejected, seconds, max_seconds, wait_seconds}}`` """
+        with self._lock:
+            return {algorithm: dict(stats) for algorithm, stats in self._stats.items()}
+
+
+pool = HasherPool(
+    settings.PASSWORD_HASHER_WORKERS,
+    settings.PASSWORD_HASHER_QUEUE_DEPTH,
+    settings.PASSWORD_HASHER_RETRY_AFTER,
+)
+
+
+def algorithm_of(encoded):
+    try:
+        return hashers.identify_hasher(encoded).algorithm
+    except ValueError:
+        return hashers.get_hasher().algorithm
+
+
+def make_password(raw_password):
+    """ ``django.contrib.auth.hashers.make_password`` run in the hasher pool """
+    return pool.run(hashers.get_hasher().algorithm, hashers.make_password, raw_password)
+
+
+def set_password(user, raw_password):
+    """ ``user.set_password`` with the hashing done in the hasher pool """
+    user.password = make_password(raw_password)
+    # Lets the password validators see the change once the user is saved
+    user._password = raw_password
+
+
+def _check_password(raw_password, encoded):
+    updates = []
+    is_correct = hashers.check_password(raw_password, encoded, setter=updates.append)
+    return is_correct, bool(updates)
+
+
+def check_password(user, raw_password):
+    """``user.check_password`` with the hashing done in the hasher pool
+
+    An outdated hash is upgraded on the calling thread, where the request's
+    database connection lives.
+    """
+    is_correct, must_update = pool.run(algorithm_of(user.password), _check_password, raw_password, user.password)
+    if is_correct and must_update:
+        set_password(user, raw_password)
+        user._password = None
+        user.save(update_fields=['password'])
+    return is_correct
@@ -0,0 +1,88 @@
+import contextvars
+import time
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .db.routers import read_alias, read_selector
+
+# Timings of the request being served, set by InstrumentationMiddleware
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    """Where the time of one request went
+
+    Queries are counted and timed by ``time_queries``.
+    """
+    __slots__ = ('started', 'db_queries', 'db_seconds', 'serializer_seconds', 'serializing')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+
+    def add_query(self, seconds):
+        self.db_queries += 1
+        self.db_seconds += seconds
+
+    @property
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+
+def time_queries(execute, sql, params, many, context):
+    """Execute wrapper reporting query durations to the current request
+
+    Installed once on every connection (see ``install_query_timer``) and
+    reading the request from context variables: under ASGI the ORM runs in
+    the thread of ``sync_to_async``, where a wrapper added around the
+    request on the event loop's connections would never see the queries.
+    The replica selector (see ``ReplicaMiddleware``) gets the durations of
+    the replica the request reads from.
+    """
+    timings = current_timings.get()
+    selector = read_selector.get()
+    if timings is None and selector is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - start
+        if timings is not None:
+            timings.add_query(seconds)
+        alias = context['connection'].alias
+        if selector is not None and alias == read_alias.get():
+            selector.observe(alias, seconds)
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # Connections reconnecting keep their wrappers
+    if time_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_queries)
+
+
+class TimedSerializerMixin:
+    """Add the time spent in ``to_representation`` to the request timings
+
+    Only the outermost serializer is timed, nested ones are part of it. Lazy
+    queries run while serializing count towards both DB and serializer time.
+    """
+
+    def to_representation(self, instance):
+        timings = current_timings.get()
+        if timings is None or timings.serializing:
+            return super().to_representation(instance)
+
+        timings.serializing = True
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            timings.serializer_seconds += time.perf_counter() - start
+            timings.serializing = False
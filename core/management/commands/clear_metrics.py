@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from core.metrics import clear_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Delete the metrics snapshots in METRICS_DIR; run it before starting a new deployment'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Deleted {clear_snapshots()} metrics snapshots')
@@ -0,0 +1,48 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+
+from core.pictures import claim_uploads, process_uploads
+from core.storage import get_storage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnails for staged profile pictures and upload them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes decoding and resizing pictures')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        storage = get_storage()
+
+        executor = ProcessPoolExecutor(max_workers=options['workers'])
+        try:
+            while True:
+                uploads = claim_uploads(options['batch_size'])
+                if not uploads:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                try:
+                    processed = process_uploads(uploads, storage, executor)
+                except BrokenProcessPool as e:
+                    # The uploads it broke stay claimed and are retried once
+                    # PROFILE_PICTURE_CLAIM_TIMEOUT passes
+                    self.stderr.write(f'{e}, starting a new pool')
+                    executor.shutdown(wait=False)
+                    executor = ProcessPoolExecutor(max_workers=options['workers'])
+                    continue
+                self.stdout.write(f'Processed {processed}/{len(uploads)} profile pictures')
+        finally:
+            executor.shutdown()
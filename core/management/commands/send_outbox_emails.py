@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.outbox import send_batch
+
+
+class Command(BaseCommand):
+    help = 'Send the emails waiting in the outbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--interval', type=float, default=2.0,
+                            help='Seconds to wait when nothing is due')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once nothing is due')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f'Sent {sent} emails, {failed} failed')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
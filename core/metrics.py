@@ -0,0 +1,276 @@
+"""In-process metrics, exported in the Prometheus text format at ``/metrics``
+
+Recording never takes a lock: every thread writes to its own shard and the
+shards are only merged when metrics are read. The shard of a thread that
+ended is folded into a retired total, so servers starting a thread per
+request don't pile them up. With several worker processes
+set ``METRICS_DIR`` to a directory they share; each process writes a snapshot
+there every ``METRICS_FLUSH_INTERVAL`` seconds and ``/metrics`` adds up all
+of them, so any worker can answer a scrape. Only counters and histograms are
+kept, which stay correct when summed, including over exited workers.
+
+Snapshots are named after the pid and a random id, so a new worker reusing a
+pid never replaces (and lowers) the totals of an exited one. Snapshots of
+exited workers are kept for that reason, so empty METRICS_DIR whenever the
+whole service restarts (``manage.py clear_metrics``); the counters of the
+previous deployment would be added otherwise.
+"""
+import atexit
+import bisect
+import itertools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+
+
+class ShardOwner:
+    """ Held by the thread-local storage only, so it dies with its thread """
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self._ids = itertools.count()
+        self.reset()
+
+    def reset(self):
+        """ Forget everything recorded, e.g. in a freshly forked worker """
+        # Cleared before the old thread-locals go, so their owners find
+        # nothing to retire
+        self._shards = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._next_flush = 0.0
+        self.snapshot_name = new_snapshot_name()
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=()):
+        return self.register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def shard(self):
+        """ This thread's ``{(name, labels): value}`` dict """
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            shard_id = next(self._ids)
+            with self._lock:
+                self._shards[shard_id] = shard
+            owner = self._local.owner = ShardOwner()
+            weakref.finalize(owner, self.retire, shard_id).atexit = False
+        return shard
+
+    def retire(self, shard_id):
+        """ Fold the shard of an ended thread into the retired total """
+        with self._lock:
+            shard = self._shards.pop(shard_id, None)
+            if shard is not None:
+                for key, value in shard.items():
+                    merge(self._retired, key, value)
+
+    def recorded(self):
+        if settings.METRICS_DIR and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def snapshot(self):
+        """ Values recorded by every thread of this process """
+        with self._lock:
+            shards = list(self._shards.values())
+            # merge() never changes lists in place, a shallow copy is enough
+            merged = dict(self._retired)
+        for shard in shards:
+            # dict.copy() is atomic, the owning thread may keep writing
+            for key, value in shard.copy().items():
+                merge(merged, key, value)
+        return merged
+
+    def flush(self):
+        """ Write this process's snapshot to METRICS_DIR """
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._next_flush = time.monotonic() + settings.METRICS_FLUSH_INTERVAL
+        finally:
+            self._lock.release()
+
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        rows = [[name, list(labels), value] for (name, labels), value in self.snapshot().items()]
+        fd, tmp_path = tempfile.mkstemp(dir=settings.METRICS_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(rows, tmp)
+        os.replace(tmp_path, os.path.join(settings.METRICS_DIR, self.snapshot_name))
+
+    def collect(self):
+        """ Values of this process, plus the other processes' when METRICS_DIR is set """
+        merged = self.snapshot()
+        if not settings.METRICS_DIR or not os.path.isdir(settings.METRICS_DIR):
+            return merged
+
+        for name in os.listdir(settings.METRICS_DIR):
+            if name == self.snapshot_name or not is_snapshot(name):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, name)) as snapshot:
+                    rows = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            for metric, labels, value in rows:
+                merge(merged, (metric, tuple(labels)), value)
+        return merged
+
+    def render(self):
+        """ Everything collected, in the Prometheus text exposition format """
+        values = self.collect()
+        by_metric = {}
+        for (name, labels), value in values.items():
+            by_metric.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for labels, value in sorted(by_metric.get(name, [])):
+                lines.extend(metric.render(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def new_snapshot_name():
+    return f'metrics-{os.getpid()}-{uuid.uuid4().hex[:12]}.json'
+
+
+def is_snapshot(name):
+    return name.startswith('metrics-') and name.endswith('.json')
+
+
+def clear_snapshots():
+    """ Delete every snapshot in METRICS_DIR, returns how many there were """
+    if not settings.METRICS_DIR or not os.path.isdir(settings.METRICS_DIR):
+        return 0
+    cleared = 0
+    for name in os.listdir(settings.METRICS_DIR):
+        if is_snapshot(name):
+            try:
+                os.remove(os.path.join(settings.METRICS_DIR, name))
+            except FileNotFoundError:
+                continue
+            cleared += 1
+    return cleared
+
+
+def merge(merged, key, value):
+    current = merged.get(key)
+    if current is None:
+        merged[key] = list(value) if isinstance(value, list) else value
+    elif isinstance(value, list):
+        merged[key] = [a + b for a, b in zip(current, value)]
+    else:
+        merged[key] = current + value
+
+
+def format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, *labels, amount=1):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+        self.registry.recorded()
+
+    def render(self, labels, value):
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}']
+
+
+class Histogram:
+    """ Stored as per-bucket counts followed by the sum and the count """
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        state = shard.get(key)
+        if state is None:
+            # One slot per bucket, one for +Inf, then sum and count
+            state = shard[key] = [0] * (len(self.buckets) + 3)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+        self.registry.recorded()
+
+    def render(self, labels, state):
+        lines = []
+        cumulative = 0
+        bounds = [format_value(float(bound)) for bound in self.buckets] + ['+Inf']
+        for bound, count in zip(bounds, state):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(state[-2])}')
+        lines.append(f'{self.name}_count{format_labels(self.labelnames, labels)} {state[-1]}')
+        return lines
+
+
+registry = Registry()
+
+REQUESTS = registry.counter(
+    'http_requests_total', 'HTTP requests served, by route, method and status.', ['route', 'method', 'status']
+)
+REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds', 'Time to serve a request, by route and method.', ['route', 'method'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_DB_QUERIES = registry.histogram(
+    'http_request_db_queries', 'SQL queries run per request, by route.', ['route'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+CACHE_REQUESTS = registry.counter(
+    'cache_requests_total', 'Cache lookups, by cache and result (hit or miss).', ['cache', 'result']
+)
+
+# Workers forked from a preloaded master would otherwise report its values too
+os.register_at_fork(after_in_child=registry.reset)
+
+
+@atexit.register
+def flush_at_exit():
+    if settings.METRICS_DIR:
+        registry.flush()
@@ -0,0 +1,237 @@
+import cProfile
+import json
+import logging
+import os
+import random
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.gzip import GZipMiddleware
+from django.utils.text import slugify
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from . import metrics
+from .db.routers import get_selector, read_alias, read_selector
+from .instrumentation import RequestTimings, current_timings
+
+logger = logging.getLogger('core.requests')
+
+
+def client_identity(request):
+    """ Who sent the request, worked out without touching the database """
+    header = request.META.get(api_settings.AUTH_HEADER_NAME)
+    if header:
+        authentication = JWTAuthentication()
+        raw_token = authentication.get_raw_token(header.encode())
+        if raw_token is not None:
+            try:
+                token = authentication.get_validated_token(raw_token)
+                return f'user:{token[api_settings.USER_ID_CLAIM]}'
+            except (InvalidToken, KeyError):
+                pass
+
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session_key:
+        return f'session:{session_key}'
+    return None
+
+
+def pin_key(identity):
+    return f'db:primary:{identity}'
+
+
+class AsyncCapableMiddleware:
+    """Base of middleware serving both WSGI and ASGI without a thread hop
+
+    Like Django's ``MiddlewareMixin``: under ASGI ``get_response`` is a
+    coroutine function and requests go to ``__acall__`` instead of ``call``,
+    so async views stay on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.call(request)
+
+
+class ReplicaMiddleware(AsyncCapableMiddleware):
+    """Route the reads of safe requests to a replica
+
+    Works with ``core.db.routers.ReplicaRouter``; does nothing unless
+    ``DATABASE_REPLICAS`` is set. Each safe request reads from one replica
+    picked by the selector, queries are timed for the ``least_latency``
+    strategy. After a client writes, its reads stay on the primary for
+    ``DATABASE_STICKY_SECONDS`` so authors see their own changes despite
+    replication lag. The pin lives in the cache, keyed by the JWT user id or
+    the session, so it is shared between processes when the cache is.
+    """
+
+    def call(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        identity = client_identity(request)
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            if identity is not None:
+                cache.set(pin_key(identity), True, settings.DATABASE_STICKY_SECONDS)
+            return response
+
+        if identity is not None and cache.get(pin_key(identity)):
+            return self.get_response(request)
+
+        with self.read_from_replica():
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        identity = client_identity(request)
+        if request.method not in SAFE_METHODS:
+            response = await self.get_response(request)
+            if identity is not None:
+                await cache.aset(pin_key(identity), True, settings.DATABASE_STICKY_SECONDS)
+            return response
+
+        if identity is not None and await cache.aget(pin_key(identity)):
+            return await self.get_response(request)
+
+        with self.read_from_replica():
+            return await self.get_response(request)
+
+    @contextmanager
+    def read_from_replica(self):
+        # Queries are timed for the selector by core.instrumentation.time_queries
+        selector = get_selector()
+        alias_token = read_alias.set(selector.choose())
+        selector_token = read_selector.set(selector)
+        try:
+            yield
+        finally:
+            read_selector.reset(selector_token)
+            read_alias.reset(alias_token)
+
+
+class InstrumentationMiddleware(AsyncCapableMiddleware):
+    """Measure every request and report it in Server-Timing and the request log
+
+    Counts and times the SQL queries sent to every database, the time spent
+    in serializers (see ``TimedSerializerMixin``) and the total. Each request
+    gets one JSON line on the ``core.requests`` logger, at WARNING when it
+    took ``REQUEST_SLOW_MS`` or more and INFO otherwise.
+
+    ``REQUEST_PROFILE_RATE`` (0 to 1) runs that fraction of requests under
+    cProfile and writes the stats to ``REQUEST_PROFILE_DIR``; read them with
+    ``python -m pstats``. At 0 the profiler is never touched. cProfile only
+    sees its own thread, so requests served under ASGI are not profiled.
+    """
+
+    def call(self, request):
+        timings = RequestTimings()
+        with self.measure(timings):
+            rate = settings.REQUEST_PROFILE_RATE
+            if rate and random.random() < rate:
+                response = self.profile(request, timings)
+            else:
+                response = self.get_response(request)
+
+        self.report(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        with self.measure(timings):
+            response = await self.get_response(request)
+
+        self.report(request, response, timings)
+        return response
+
+    @contextmanager
+    def measure(self, timings):
+        # Queries are counted by core.instrumentation.time_queries
+        token = current_timings.set(timings)
+        try:
+            yield
+        finally:
+            current_timings.reset(token)
+
+    def profile(self, request, timings):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.disable()
+            os.makedirs(settings.REQUEST_PROFILE_DIR, exist_ok=True)
+            name = '{:%Y%m%dT%H%M%S}-{}-{}-{:.0f}ms-{}.prof'.format(
+                datetime.now(), request.method, slugify(request.path.replace('/', ' ')) or 'root',
+                timings.total_seconds * 1000, uuid.uuid4().hex[:8],
+            )
+            profiler.dump_stats(os.path.join(settings.REQUEST_PROFILE_DIR, name))
+
+    def report(self, request, response, timings):
+        match = request.resolver_match
+        # Label by route name, not path, to keep the number of series bounded
+        route = (match.view_name if match else None) or 'unmatched'
+        total_seconds = timings.total_seconds
+        metrics.REQUESTS.inc(route, request.method, str(response.status_code))
+        metrics.REQUEST_DURATION.observe(total_seconds, route, request.method)
+        metrics.REQUEST_DB_QUERIES.observe(timings.db_queries, route)
+
+        total_ms = total_seconds * 1000
+        db_ms = timings.db_seconds * 1000
+        serializer_ms = timings.serializer_seconds * 1000
+        response['Server-Timing'] = (
+            f'db;desc="{timings.db_queries} queries";dur={db_ms:.1f}, '
+            f'serialize;dur={serializer_ms:.1f}, '
+            f'total;dur={total_ms:.1f}'
+        )
+
+        level = logging.WARNING if total_ms >= settings.REQUEST_SLOW_MS else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        logger.log(level, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(total_ms, 1),
+            'db_queries': timings.db_queries,
+            'db_ms': round(db_ms, 1),
+            'serializer_ms': round(serializer_ms, 1),
+        }))
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """Gzip responses the client accepts gzip for, when it pays off
+
+    Only ``GZIP_CONTENT_TYPES`` are compressed, and only bodies of at least
+    ``GZIP_MIN_SIZE`` bytes; below about a kilobyte the CPU time is not
+    won back on the wire. Streaming responses are compressed chunk by chunk
+    as they are sent, whatever their size.
+    """
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip()
+        if content_type not in settings.GZIP_CONTENT_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_SIZE:
+            return response
+        return super().process_response(request, response)
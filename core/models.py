@@ -2,22 +2,100 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 class Profile(models.Model):
     """ User profile model with all the main user data  """
 
     user = models.OneToOneField(User, related_name='profile', on_delete=models.CASCADE)
     bio = models.TextField(max_length=2000, null=True , blank=True)
-    profile_picture = models.URLField(max_length=1000, null=True , blank=True)
+    # Storage key of the picture, URLs are made on read (see core.storage)
+    profile_picture = models.CharField(max_length=1000, null=True , blank=True)
     profile_picture
+    # Moves with the user's names too (see touch_profile), ETags of
+    # responses rendering profiles are derived from it
+    updated_at = models.DateTimeField(auto_now=True)
         
     def __str__(self):
         """ Show the username """
         return str(self.user)
 
 
+class ProfilePictureUpload(models.Model):
+    """ Profile picture waiting in the staging area for the picture worker """
+
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    profile = models.ForeignKey(Profile, related_name='picture_uploads', on_delete=models.CASCADE)
+    staged_path = models.CharField(max_length=1000)
+    content_type = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    error = models.TextField(blank=True, default='')
+    # Set when a worker claims the upload; PROCESSING rows claimed longer ago
+    # than PROFILE_PICTURE_CLAIM_TIMEOUT belong to a dead worker
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'Picture upload {self.pk} for {self.profile_id} ({self.status})'
+
+
+class OutboxEmail(models.Model):
+    """ Email written with the request's transaction and sent later by the outbox worker """
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    to = models.EmailField()
+    template_name = models.CharField(max_length=255)
+    context = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_attempt_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to} ({self.status})'
+
+
 @receiver(post_save,sender=User)
 def create_profile(sender,instance,created,**kwargs):
     """ Create new profile for each new user """
     if created:
-        Profile.objects.create(user=instance)
\ No newline at end of file
+        Profile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def touch_profile(sender, instance, created, update_fields=None, **kwargs):
+    """ Move the profile's updated_at when the user data it renders changes """
+    # Logins only touch last_login and password rehashes, which no profile
+    # rendering shows
+    if created or (update_fields is not None and set(update_fields) <= {'last_login', 'password'}):
+        return
+    Profile.objects.filter(user_id=instance.pk).update(updated_at=timezone.now())
@@ -0,0 +1,111 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from .models import OutboxEmail
+
+
+def queue_email(subject, template_name, context, to, from_email=None):
+    """ Write an email to the outbox; it is sent once the surrounding transaction commits """
+    return OutboxEmail.objects.create(
+        subject=subject,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=to,
+        template_name=template_name,
+        context=context,
+    )
+
+
+def retry_delay(attempts):
+    """ Exponential backoff: base delay, doubled per failed attempt, capped """
+    delay = settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_RETRY_DELAY))
+
+
+def render(email, templates):
+    template = templates.get(email.template_name)
+    if template is None:
+        template = templates[email.template_name] = get_template(email.template_name)
+
+    html_message = template.render(email.context)
+    message = EmailMultiAlternatives(email.subject, strip_tags(html_message), email.from_email, [email.to])
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def record_failure(email, error):
+    """ Schedule the next attempt, or give up once EMAIL_OUTBOX_MAX_ATTEMPTS are used """
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def claim_batch(batch_size):
+    """Take a batch of due emails, skipping ones other workers hold
+
+    Claiming counts an attempt and moves ``next_attempt_at`` past
+    EMAIL_OUTBOX_CLAIM_TIMEOUT, then commits: no lock is held while sending,
+    and the emails of a worker that died are taken again after the timeout.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboxEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_TIMEOUT)
+        OutboxEmail.objects.bulk_update(emails, ['attempts', 'next_attempt_at'])
+    return emails
+
+
+def send_batch(batch_size=None):
+    """Send one batch of due emails over a single connection
+
+    Emails are claimed first (see ``claim_batch``) and sent afterwards, so an
+    email is sent at least once; it is sent twice only if the worker dies
+    between sending it and recording it. When the mail server can't be
+    reached the whole batch is retried with backoff. Returns (sent, failed).
+    """
+    emails = claim_batch(batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE)
+    sent = failed = 0
+    if not emails:
+        return sent, failed
+
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            record_failure(email, e)
+        failed = len(emails)
+    else:
+        # Templates are loaded and compiled once per batch
+        templates = {}
+        try:
+            for email in emails:
+                try:
+                    message = render(email, templates)
+                    message.connection = connection
+                    message.send()
+                except Exception as e:
+                    failed += 1
+                    record_failure(email, e)
+                else:
+                    sent += 1
+                    email.status = OutboxEmail.SENT
+                    email.sent_at = timezone.now()
+        finally:
+            connection.close()
+
+    OutboxEmail.objects.bulk_update(emails, ['status', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
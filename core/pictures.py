@@ -0,0 +1,210 @@
+import contextlib
+import io
+import os
+import uuid
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+import magic
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Profile, ProfilePictureUpload
+
+EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/svg+xml': 'svg',
+}
+
+# Formats Pillow can decode; anything else is stored without thumbnails
+RASTER_TYPES = ('image/jpeg', 'image/png')
+
+
+def extension(content_type):
+    return EXTENSIONS.get(content_type, content_type.split('/')[-1])
+
+
+def stage_profile_picture(profile, picture):
+    """Write an uploaded picture to the staging area and queue it
+
+    Returns right away; the picture worker (`manage.py process_profile_pictures`)
+    generates the thumbnails, uploads everything and updates the profile.
+    """
+    content_type = magic.Magic(mime=True).from_buffer(picture.read(2048))
+    picture.seek(0)
+
+    os.makedirs(settings.PROFILE_PICTURE_STAGING_DIR, exist_ok=True)
+    staged_path = os.path.join(settings.PROFILE_PICTURE_STAGING_DIR, f'{uuid.uuid4().hex}.{extension(content_type)}')
+    with open(staged_path, 'wb') as staged:
+        for chunk in picture.chunks():
+            staged.write(chunk)
+
+    return ProfilePictureUpload.objects.create(
+        profile=profile,
+        staged_path=staged_path,
+        content_type=content_type,
+    )
+
+
+def render_thumbnails(path, content_type, sizes):
+    """Decode a staged picture and encode its thumbnails
+
+    Runs in a worker process, so it only takes and returns plain data:
+    a list of (name, content, content_type) tuples, with a WebP variant
+    next to every thumbnail in the original format.
+    """
+    from PIL import Image, ImageOps
+
+    if content_type not in RASTER_TYPES:
+        return []
+
+    variants = []
+    with Image.open(path) as image:
+        # Let the JPEG decoder downscale while decoding, much cheaper than a full decode
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        is_png = content_type == 'image/png'
+        fmt = 'PNG' if is_png else 'JPEG'
+
+        for size in sizes:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((size, size), Image.LANCZOS)
+            if not is_png and thumbnail.mode != 'RGB':
+                thumbnail = thumbnail.convert('RGB')
+
+            for variant_fmt, variant_type in ((fmt, content_type), ('WEBP', 'image/webp')):
+                buffer = io.BytesIO()
+                thumbnail.save(buffer, variant_fmt, quality=85)
+                variants.append((f'{size}.{extension(variant_type)}', buffer.getvalue(), variant_type))
+    return variants
+
+
+def picture_prefix(upload):
+    return f'profile/{upload.profile_id}/{upload.pk}'
+
+
+def claim_uploads(batch_size):
+    """Take a batch of uploads, skipping ones other workers hold
+
+    Pending uploads are taken, and so are uploads whose worker died: still
+    PROCESSING ``PROFILE_PICTURE_CLAIM_TIMEOUT`` seconds after being
+    claimed. Those that already used ``PROFILE_PICTURE_MAX_ATTEMPTS`` (a
+    picture crashing the worker every time) are failed instead.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.PROFILE_PICTURE_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        uploads = list(
+            ProfilePictureUpload.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=ProfilePictureUpload.PENDING)
+                | Q(status=ProfilePictureUpload.PROCESSING, claimed_at__lt=stale)
+            )
+            .order_by('pk')[:batch_size]
+        )
+        exhausted = [upload for upload in uploads if upload.attempts >= settings.PROFILE_PICTURE_MAX_ATTEMPTS]
+        uploads = [upload for upload in uploads if upload.attempts < settings.PROFILE_PICTURE_MAX_ATTEMPTS]
+        ProfilePictureUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).update(
+            status=ProfilePictureUpload.PROCESSING,
+            claimed_at=now,
+            attempts=F('attempts') + 1,
+        )
+
+    for upload in exhausted:
+        fail_upload(upload, f'Worker stopped while processing it {upload.attempts} times')
+    for upload in uploads:
+        upload.status = ProfilePictureUpload.PROCESSING
+        upload.claimed_at = now
+        upload.attempts += 1
+    return uploads
+
+
+def claimed(upload):
+    """ The upload row, as long as no other worker took it over since ``upload`` was claimed """
+    return ProfilePictureUpload.objects.filter(pk=upload.pk, claimed_at=upload.claimed_at)
+
+
+def remove_staged(upload):
+    # Another worker may have finished with it already
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(upload.staged_path)
+
+
+def complete_upload(upload, picture_key):
+    """ Returns False when another worker took the upload over in the meantime """
+    with transaction.atomic():
+        if not claimed(upload).update(status=ProfilePictureUpload.DONE, processed_at=timezone.now()):
+            return False
+        # A newer upload that already finished wins over this one
+        newer = ProfilePictureUpload.objects.filter(
+            profile_id=upload.profile_id, pk__gt=upload.pk, status=ProfilePictureUpload.DONE
+        )
+        if not newer.exists():
+            # Saved rather than updated so receivers see the new picture,
+            # updated_at moves the ETags of responses rendering the profile
+            profile = Profile.objects.get(pk=upload.profile_id)
+            profile.profile_picture = picture_key
+            profile.save(update_fields=['profile_picture', 'updated_at'])
+    return True
+
+
+def fail_upload(upload, error):
+    """ Mark the upload failed for good and drop its staged file """
+    failed = claimed(upload).update(
+        status=ProfilePictureUpload.FAILED,
+        error=str(error),
+        processed_at=timezone.now(),
+    )
+    if failed:
+        remove_staged(upload)
+
+
+def process_uploads(uploads, storage, executor, sizes=None):
+    """Render thumbnails in ``executor`` and store every variant in ``storage``
+
+    Returns the number of uploads processed successfully. A process of the
+    pool dying breaks every render in flight, not only the one that killed
+    it: those uploads are left claimed for the next worker (see
+    ``claim_uploads``) and BrokenProcessPool is raised once the rest are
+    done, for the caller to start a new pool.
+    """
+    sizes = sizes or settings.PROFILE_PICTURE_THUMBNAIL_SIZES
+    broken = False
+    futures = {}
+    for upload in uploads:
+        try:
+            futures[executor.submit(render_thumbnails, upload.staged_path, upload.content_type, sizes)] = upload
+        except BrokenProcessPool:
+            broken = True
+            break
+
+    processed = 0
+    for future in as_completed(futures):
+        upload = futures[future]
+        prefix = picture_prefix(upload)
+        try:
+            variants = future.result()
+            original_key = f'{prefix}/original.{extension(upload.content_type)}'
+            with open(upload.staged_path, 'rb') as staged:
+                storage.save(original_key, staged, upload.content_type)
+            for name, content, content_type in variants:
+                storage.save(f'{prefix}/{name}', io.BytesIO(content), content_type)
+        except BrokenProcessPool:
+            broken = True
+            continue
+        except Exception as e:
+            fail_upload(upload, e)
+            continue
+
+        if complete_upload(upload, original_key):
+            remove_staged(upload)
+            processed += 1
+
+    if broken:
+        raise BrokenProcessPool(f'Processed {processed}/{len(uploads)} profile pictures before the pool broke')
+    return processed
@@ -1,38 +1,83 @@
+import copy
+
 import magic
 
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.contrib.auth.hashers import make_password
 from django.utils.http import  urlsafe_base64_decode
 from django.utils.encoding import force_str
 
 from rest_framework import  serializers
 
-from botocore.exceptions import NoCredentialsError
-
+from . import hashing
+from .instrumentation import TimedSerializerMixin
 from .models import Profile
-from .clients import s3_client, R2_BUCKET_NAME
+from .pictures import stage_profile_picture
+from .storage import picture_url
+
+class DynamicFieldsModelSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    # Pruned, unbound fields per (serializer class, fields, exclude). Building
+    # them means introspecting the model, so it is done once per process and
+    # every new serializer instance only copies the result.
+    _field_layouts = {}
 
-class DynamicFieldsModelSerializer(serializers.ModelSerializer):
     def __init__(self, *args, **kwargs):
         # Don't pass the 'fields' arg up to the superclass
         fields = kwargs.pop('fields', None)
         exclude = kwargs.pop('exclude', None)
 
+        self._field_layout_key = (
+            type(self),
+            frozenset(fields) if fields is not None else None,
+            frozenset(exclude) if exclude is not None else None,
+        )
+
         # Instantiate the superclass normally
         super(DynamicFieldsModelSerializer, self).__init__(*args, **kwargs)
 
+    def get_fields(self):
+        serializer_class, fields, exclude = self._field_layout_key
+        available = self.get_field_layout((serializer_class, None, None)).keys()
+
+        # Unknown names don't change the layout; keeping them out of the key
+        # stops client supplied field lists from growing the cache unbounded
+        if fields is not None:
+            fields = frozenset(fields & available)
+        if exclude is not None:
+            exclude = frozenset(exclude & available)
+
+        return copy.deepcopy(self.get_field_layout((serializer_class, fields, exclude)))
+
+    def get_field_layout(self, key):
+        layout = self._field_layouts.get(key)
+        if layout is None:
+            layout = self.build_field_layout(*key)
+            self._field_layouts[key] = layout
+        return layout
+
+    def build_field_layout(self, serializer_class, fields, exclude):
+        if fields is None and exclude is None:
+            return super(DynamicFieldsModelSerializer, self).get_fields()
+
+        layout = dict(self.get_field_layout((serializer_class, None, None)))
+
         if fields is not None:
             # Drop any fields that are not specified in the `fields` argument.
-            allowed = set(fields)
-            existing = set(self.fields)
-            for field_name in existing - allowed:
-                self.fields.pop(field_name)
+            for field_name in set(layout) - fields:
+                layout.pop(field_name)
 
         if exclude is not None:
             # Drop fields specified in 'exclude' argument
             for field_name in exclude:
-                self.fields.pop(field_name, None)
+                layout.pop(field_name, None)
+
+        return layout
+
+class StorageURLField(serializers.ReadOnlyField):
+    """ URL of an object whose storage key is kept in the model """
+
+    def to_representation(self, value):
+        return picture_url(value)
 
 class SignupSerializer(serializers.ModelSerializer):
     """ Signup New User Serializer Class """
@@ -42,13 +87,13 @@ class SignupSerializer(serializers.ModelSerializer):
 
 
     def validate_password(self, value: str) -> str:
-        return make_password(value)
+        return hashing.make_password(value)
 
 class ProfileSerializer(DynamicFieldsModelSerializer):
     """ Profile Serializer """
 
     profile_picture = serializers.ImageField(write_only=True, required=False)
-    profile_picture_url = serializers.URLField(source='profile_picture', read_only=True)
+    profile_picture_url = StorageURLField(source='profile_picture')
     first_name = serializers.CharField(required=False)
     last_name = serializers.CharField(required=False)
 
@@ -83,7 +128,8 @@ class ProfileSerializer(DynamicFieldsModelSerializer):
         """
         SUPPORTED_TYPES = ['jpg', 'jpeg', 'png', 'svg']
         mime = magic.Magic(mime=True)
-        mime_type = mime.from_buffer(value.read())
+        # The type is in the first bytes, no need to read the whole file
+        mime_type = mime.from_buffer(value.read(2048))
         value.seek(0)
         if mime_type.split('/')[1] not in SUPPORTED_TYPES:
             raise serializers.ValidationError(f"Only image files witn extensions {SUPPORTED_TYPES} allowed.")
@@ -94,27 +140,10 @@ class ProfileSerializer(DynamicFieldsModelSerializer):
         last_name = validated_data.pop('last_name', profile.user.last_name)
         profile_picture = validated_data.pop('profile_picture', None)
 
-        profie_pic_name = f"{first_name.lower()}_{last_name.lower()}_profile"
         if profile_picture:
             try:
-                mime = magic.Magic(mime=True)
-                mime_type = mime.from_buffer(profile_picture.read())
-                profile_picture.seek(0)
-                image_name = f"profile/{profie_pic_name}.{mime_type.split('/')[1]}"
-                s3_client.upload_fileobj(
-                    profile_picture,
-                    R2_BUCKET_NAME,
-                    image_name,
-                    ExtraArgs={'ContentType': f'{mime_type}'}
-                )
-                file_url = s3_client.generate_presigned_url('get_object',
-                    Params={'Bucket': R2_BUCKET_NAME, 'Key': f"{image_name}"},
-                    ExpiresIn=604799 #week expiry
-                )
-                validated_data['profile_picture'] = file_url
-            except NoCredentialsError:
-                raise serializers.ValidationError("Credentials not available")
-            except Exception as e:
+                stage_profile_picture(profile, profile_picture)
+            except OSError as e:
                 raise serializers.ValidationError(f"Error uploading profile image: {str(e)}")
 
         if first_name is not None or last_name is not None:
@@ -177,6 +206,6 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
     def save(self):
         uid = force_str(urlsafe_base64_decode(self.validated_data['uidb64']))
         user = User.objects.get(pk=uid)
-        user.set_password(self.validated_data['new_password'])
+        hashing.set_password(user, self.validated_data['new_password'])
         user.save()
         return user
\ No newline at end of file
@@ -0,0 +1,149 @@
+import functools
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from boto3.s3.transfer import TransferConfig
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .clients import s3_client, R2_BUCKET_NAME
+
+
+def join_url(base, key):
+    # urljoin would drop the last path segment of a base without a trailing slash
+    return f"{base.rstrip('/')}/{key}"
+
+
+class S3Storage:
+    """Objects stored in the R2 (S3 compatible) bucket
+
+    Only object keys are persisted; URLs are made when reading. With
+    PROFILE_PICTURE_PUBLIC_URL set (a CDN or public bucket domain) they are
+    plain links, otherwise presigned URLs. A presigned URL is reused for
+    every read within the same PROFILE_PICTURE_URL_REFRESH window, so it is
+    signed once per key and window and stays valid for at least
+    PROFILE_PICTURE_URL_EXPIRY - PROFILE_PICTURE_URL_REFRESH seconds.
+    """
+
+    def __init__(self, client=None, bucket=None, public_url=None):
+        self.client = client or s3_client
+        self.bucket = bucket or R2_BUCKET_NAME
+        self.public_url = public_url or settings.PROFILE_PICTURE_PUBLIC_URL
+        # Per instance rather than on the method, which would keep every
+        # instance alive in a cache shared by the class
+        self.presigned_url = functools.lru_cache(maxsize=10000)(self._presigned_url)
+        # Large files are streamed in parts, so memory stays at about
+        # chunksize * concurrency whatever the file size
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_MAX_CONCURRENCY,
+        )
+
+    def save(self, key, fileobj, content_type):
+        self.client.upload_fileobj(
+            fileobj,
+            self.bucket,
+            key,
+            ExtraArgs={'ContentType': content_type},
+            Config=self.transfer_config,
+        )
+        return key
+
+    def url(self, key):
+        if self.public_url:
+            return join_url(self.public_url, key)
+        return self.presigned_url(key, self.url_window())
+
+    def url_window(self):
+        """ Changes whenever url() starts returning new URLs for the same keys """
+        if self.public_url:
+            return None
+        return int(time.time() // settings.PROFILE_PICTURE_URL_REFRESH)
+
+    def _presigned_url(self, key, window):
+        return self.client.generate_presigned_url('get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=settings.PROFILE_PICTURE_URL_EXPIRY
+        )
+
+
+class LocalStorage:
+    """ Objects stored under MEDIA_ROOT, a stand-in for R2 in development and tests """
+
+    def __init__(self, root=None, base_url=None):
+        self._root = root
+        self._base_url = base_url
+
+    @property
+    def root(self):
+        return self._root or settings.MEDIA_ROOT
+
+    @property
+    def base_url(self):
+        return self._base_url or settings.MEDIA_URL
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def save(self, key, fileobj, content_type):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as destination:
+            for chunk in iter(lambda: fileobj.read(64 * 1024), b''):
+                destination.write(chunk)
+        return key
+
+    def url(self, key):
+        return join_url(self.base_url, key)
+
+    def url_window(self):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def load_storage(path):
+    return import_string(path)()
+
+
+def get_storage():
+    """ Storage backend configured by PROFILE_PICTURE_STORAGE """
+    return load_storage(settings.PROFILE_PICTURE_STORAGE)
+
+
+def legacy_key(url):
+    """Object key of a presigned URL stored before keys were
+
+    Those URLs expired a week after the upload; the key is in their path,
+    after the bucket name with path-style addressing. Returns None for any
+    other URL.
+    """
+    parts = urlsplit(url)
+    if 'X-Amz-Signature' not in parse_qs(parts.query):
+        return None
+    key = parts.path.lstrip('/')
+    bucket = f'{R2_BUCKET_NAME}/'
+    if R2_BUCKET_NAME and key.startswith(bucket):
+        key = key[len(bucket):]
+    return key or None
+
+
+def picture_url(value):
+    """ Public URL of a stored profile picture """
+    if not value:
+        return None
+    # Pictures uploaded before keys were stored hold a full URL, presigned
+    # (and long expired) ones are signed again from their key
+    if value.startswith(('http://', 'https://')):
+        key = legacy_key(value)
+        if key is None:
+            return value
+        value = key
+    return get_storage().url(value)
+
+
+def picture_url_window():
+    """ Changes whenever picture_url starts returning new URLs, for validators of responses rendering them """
+    return get_storage().url_window()
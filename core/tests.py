@@ -1,3 +1,782 @@
-from django.test import TestCase
+import gc
+import gzip
+import io
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import uuid
+import weakref
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+import boto3
+from PIL import Image
+from unittest import mock
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.utils import ConnectionHandler
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import hashing, metrics, renderers
+from .authentication import CachedRefreshToken, blacklist_cache, user_cache
+from blog.models import Category, Post, Tag
+from .db.routers import ReplicaSelector, get_selector
+from .models import OutboxEmail, Profile, ProfilePictureUpload
+from .outbox import claim_batch
+from .pictures import claim_uploads
+from .serializers import DynamicFieldsModelSerializer, ProfileSerializer
+from .storage import S3Storage, picture_url
+
+
+class QueryBudgetMixin:
+    """ Fail a test when a request runs more SQL queries than its budget allows """
+
+    def assertQueryBudget(self, budget, method, url, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+        queries = '\n'.join(query['sql'] for query in ctx.captured_queries)
+        self.assertLessEqual(
+            len(ctx), budget,
+            f'{method.upper()} {url} ran {len(ctx)} queries, budget is {budget}:\n{queries}'
+        )
+        return response
+
+
+class AccountsQueryBudgetTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='john', email='john@example.com', password='secret-pass-123',
+            first_name='John', last_name='Doe'
+        )
+
+    def test_login(self):
+        response = self.assertQueryBudget(
+            2, 'post', reverse('accounts:login'),
+            data={'username': 'john', 'password': 'secret-pass-123'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_profile_get(self):
+        self.client.force_authenticate(self.user)
+        response = self.assertQueryBudget(1, 'get', reverse('accounts:profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['profile']['first_name'], 'John')
+
+    def test_signup(self):
+        response = self.assertQueryBudget(
+            6, 'post', reverse('accounts:register'),
+            data={'username': 'jane', 'email': 'jane@example.com', 'password': 'secret-pass-123'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class CachedJWTAuthenticationTests(QueryBudgetMixin, APITestCase):
+
+    def setUp(self):
+        user_cache.clear()
+        blacklist_cache.clear()
+        self.user = User.objects.create_user(
+            username='john', email='john@example.com', password='secret-pass-123', first_name='John'
+        )
+        response = self.client.post(
+            reverse('accounts:login'), data={'username': 'john', 'password': 'secret-pass-123'}
+        )
+        self.access, self.refresh = response.data['access'], response.data['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def test_user_and_profile_are_cached_between_requests(self):
+        # Authentication, then the profile lookup of the view
+        self.assertQueryBudget(2, 'get', reverse('accounts:profile'))
+        response = self.assertQueryBudget(1, 'get', reverse('accounts:profile'))
+        self.assertEqual(response.status_code, 200)
+
+        cached = user_cache.get(self.user.pk)
+        self.assertIsNotNone(cached)
+
+    def test_saving_the_user_or_profile_invalidates_the_cache(self):
+        self.client.get(reverse('accounts:profile'))
+        self.user.profile.bio = 'Changed'
+        self.user.profile.save()
+        self.assertIsNone(user_cache.get(self.user.pk))
+
+        self.client.get(reverse('accounts:profile'))
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse('accounts:profile'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_blacklist_lookups_are_cached_and_invalidated(self):
+        url = reverse('accounts:token_verify')
+        self.assertEqual(self.client.post(url, data={'token': self.refresh}).status_code, 200)
+        response = self.assertQueryBudget(0, 'post', url, data={'token': self.refresh})
+        self.assertEqual(response.status_code, 200)
+
+        CachedRefreshToken(self.refresh).blacklist()
+        self.assertEqual(self.client.post(url, data={'token': self.refresh}).status_code, 400)
+        response = self.client.post(reverse('accounts:token_refresh'), data={'refresh': self.refresh})
+        self.assertEqual(response.status_code, 401)
+
+
+class HasherPoolTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='john', password='secret-pass-123')
+        self.pool = hashing.HasherPool(workers=1, queue_depth=0, retry_after=7)
+        patcher = mock.patch.object(hashing, 'pool', self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def login(self, password='secret-pass-123'):
+        return self.client.post(reverse('accounts:login'), data={'username': 'john', 'password': password})
+
+    def test_hashes_run_in_the_pool_and_are_timed(self):
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login('wrong').status_code, 401)
+
+        stats = self.pool.stats()['pbkdf2_sha256']
+        self.assertEqual((stats['count'], stats['rejected']), (2, 0))
+        self.assertGreater(stats['seconds'], 0)
+
+    def test_saturated_pool_rejects_with_429(self):
+        self.pool._slots.acquire()
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(self.pool.stats()['pbkdf2_sha256']['rejected'], 1)
+
+        self.pool._slots.release()
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_saturated_pool_is_a_form_error_in_the_admin(self):
+        User.objects.create_superuser(username='admin', password='secret-pass-123')
+        self.pool._slots.acquire()
+        self.addCleanup(self.pool._slots.release)
+        response = self.client.post(reverse('admin:login'), data={'username': 'admin', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Too many password operations in progress.')
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher', 'django.contrib.auth.hashers.MD5PasswordHasher'
+    ])
+    def test_outdated_hashes_are_upgraded(self):
+        self.user.password = make_password('secret-pass-123', hasher='md5')
+        self.user.save()
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+
+
+class DatabaseConnectionTests(APITestCase):
+
+    @mock.patch('psycopg_pool.ConnectionPool')
+    def test_pooled_backend_borrows_and_returns_connections(self, pool_class):
+        from .db.postgresql.base import DatabaseWrapper
+        self.addCleanup(DatabaseWrapper._pools.clear)
+
+        connection = ConnectionHandler({'default': {
+            'ENGINE': 'core.db.postgresql', 'NAME': 'blog', 'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': {'max_size': 4, 'timeout': 5}},
+        }})['default']
+        pool = pool_class.return_value
+
+        params = connection.get_connection_params()
+        self.assertNotIn('pool', params)
+        raw = connection.get_new_connection(params)
+        self.assertIs(raw, pool.getconn.return_value)
+
+        kwargs = pool_class.call_args.kwargs
+        self.assertEqual((kwargs['max_size'], kwargs['timeout']), (4, 5))
+        self.assertIs(kwargs['check'], pool_class.check_connection)
+
+        connection.connection = raw
+        connection._close()
+        pool.putconn.assert_called_once_with(raw)
+
+        pool.get_stats.return_value = {'pool_size': 1}
+        self.assertEqual(connection.pool_stats(), {'pool_size': 1})
+        self.assertEqual(pool_class.call_count, 1)
+
+    def test_stats_endpoint_is_admin_only(self):
+        url = reverse('database-stats')
+        user = User.objects.create_user(username='john', password='secret-pass-123')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        user.is_staff = True
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['data']['databases']['default']['pool'], None)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], DATABASE_STICKY_SECONDS=60)
+class ReplicaRoutingTests(APITestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(username='john', password='secret-pass-123')
+        self.author = APIClient()
+        self.author.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def post_count(self, client):
+        return client.get(reverse('blog:post-list')).data['count']
+
+    def test_reads_go_to_the_replica_until_the_client_writes(self):
+        # Rows only exist on the primary here, so an empty list means a replica read
+        Post.objects.create(title='Hello', content='Lorem ipsum', author=self.user.profile)
+        self.assertEqual(self.post_count(self.client), 0)
+
+        category = Category.objects.create(name='News', slug='news')
+        tag = Tag.objects.create(name='Django', slug='django')
+        response = self.author.post(reverse('blog:post-list'), data={
+            'title': 'New', 'content': 'Lorem', 'categories': [category.pk], 'tags': [tag.pk]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.post_count(self.author), 2)
+        self.assertEqual(self.post_count(self.client), 0)
+
+        # Pin expired
+        cache.clear()
+        self.assertEqual(self.post_count(self.author), 0)
+
+    async def test_async_views_read_from_the_replica_without_a_thread_hop(self):
+        await Post.objects.acreate(title='Hello', content='Lorem ipsum', author=await Profile.objects.aget(user=self.user))
+        get_selector().latencies.clear()
+        # With DEBUG on, Django logs every middleware it has to adapt between sync and async
+        with override_settings(DEBUG=True), self.assertNoLogs('django.request', 'DEBUG'):
+            response = await AsyncClient().get(reverse('blog-async:post-list'))
+        self.assertEqual(json.loads(response.content)['results'], [])
+        # The ORM runs in the sync_to_async thread, its queries are still counted
+        queries = int(re.search(r'db;desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreater(queries, 0)
+        self.assertIn('replica', get_selector().latencies)
+
+    def test_objects_read_from_a_replica_are_saved_to_the_primary(self):
+        post = Post(title='Hello', content='Lorem ipsum', author=self.user.profile)
+        post._state.db = 'replica'
+        self.assertEqual(router.db_for_write(Post, instance=post), 'default')
+        self.assertEqual(router.db_for_read(Post, instance=post), 'replica')
+
+    def test_replica_selection(self):
+        selector = ReplicaSelector(['a', 'b'])
+        self.assertEqual([selector.choose() for _ in range(3)], ['a', 'b', 'a'])
+
+        selector = ReplicaSelector(['a', 'b'], 'least_latency', probe_every=4)
+        selector.observe('a', 0.050)
+        selector.observe('b', 0.010)
+        self.assertEqual([selector.choose() for _ in range(4)], ['b', 'b', 'b', 'a'])
+        selector.observe('b', 0.500)
+        self.assertEqual(selector.choose(), 'a')
+
+
+class InstrumentationTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='john', password='secret-pass-123', first_name='John')
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing_and_request_log(self):
+        with self.assertLogs('core.requests', 'INFO') as logs:
+            response = self.client.get(reverse('accounts:profile'))
+
+        timing = dict(
+            re.match(r'(\w+);(?:desc="[^"]*";)?dur=([\d.]+)', metric.strip()).groups()
+            for metric in response['Server-Timing'].split(',')
+        )
+        self.assertEqual(set(timing), {'db', 'serialize', 'total'})
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertGreater(float(timing['serialize']), 0)
+        self.assertGreaterEqual(float(timing['total']), float(timing['db']))
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'accounts:profile')
+        self.assertEqual((record['status'], record['db_queries']), (200, 1))
+
+    def test_sampled_requests_are_profiled(self):
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with override_settings(REQUEST_PROFILE_RATE=1, REQUEST_PROFILE_DIR=profile_dir):
+                self.client.get(reverse('accounts:profile'))
+            with override_settings(REQUEST_PROFILE_RATE=0, REQUEST_PROFILE_DIR=profile_dir):
+                self.client.get(reverse('accounts:profile'))
+
+            profiles = os.listdir(profile_dir)
+            self.assertEqual(len(profiles), 1)
+            self.assertIn('GET-api-v1-accounts-profile', profiles[0])
+            stats = pstats.Stats(os.path.join(profile_dir, profiles[0]))
+            self.assertGreater(stats.total_calls, 0)
+
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='john', password='secret-pass-123', is_staff=True)
+        self.client.force_authenticate(self.user)
+        self.client.force_login(self.user)
+
+    def scrape(self, **kwargs):
+        response = self.client.get(reverse('metrics'), **kwargs)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode()
+
+    @override_settings(TAXONOMY_CACHE_ENABLED=True)
+    def test_requests_and_cache_lookups_are_exported(self):
+        self.client.get(reverse('accounts:profile'))
+        self.client.get(reverse('accounts:profile'))
+        self.client.get(reverse('blog:category-list'))
+        self.client.get(reverse('blog:category-list'))
+
+        body = self.scrape()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_requests_total{route="accounts:profile",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{route="accounts:profile",method="GET"} 2', body)
+        self.assertIn('http_request_duration_seconds_bucket{route="accounts:profile",method="GET",le="+Inf"} 2', body)
+        self.assertIn('http_request_db_queries_bucket{route="accounts:profile",le="1.0"} 2', body)
+        self.assertIn('cache_requests_total{cache="blog_response",result="hit"} 1', body)
+        self.assertIn('cache_requests_total{cache="blog_response",result="miss"} 1', body)
+
+    def test_threads_and_processes_are_summed(self):
+        def work():
+            for _ in range(1000):
+                metrics.CACHE_REQUESTS.inc('test', 'hit')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            # Snapshot left by another worker process
+            with open(os.path.join(metrics_dir, 'metrics-1.json'), 'w') as other:
+                json.dump([['cache_requests_total', ['test', 'hit'], 500]], other)
+            body = metrics.registry.render()
+
+        self.assertIn('cache_requests_total{cache="test",result="hit"} 4500', body)
+
+    def test_shards_of_ended_threads_are_retired(self):
+        def work():
+            metrics.CACHE_REQUESTS.inc('test', 'hit')
+            metrics.REQUEST_DB_QUERIES.observe(2, 'test')
+
+        # Like runserver, one short-lived thread per request
+        for _ in range(200):
+            thread = threading.Thread(target=work)
+            thread.start()
+            thread.join()
+        work()
+
+        self.assertLessEqual(len(metrics.registry._shards), 2)
+        body = metrics.registry.render()
+        self.assertIn('cache_requests_total{cache="test",result="hit"} 201', body)
+        self.assertIn('http_request_db_queries_count{route="test"} 201', body)
+
+    def test_label_values_are_escaped(self):
+        metrics.CACHE_REQUESTS.inc('a"b\\c\nd', 'hit')
+        self.assertIn('cache_requests_total{cache="a\\"b\\\\c\\nd",result="hit"} 1', metrics.registry.render())
+
+    def test_snapshots_of_exited_workers_are_kept(self):
+        with tempfile.TemporaryDirectory() as metrics_dir, override_settings(METRICS_DIR=metrics_dir):
+            metrics.CACHE_REQUESTS.inc('test', 'hit', amount=5)
+            metrics.registry.flush()
+            # A new worker, even one reusing the pid, writes a snapshot of its own
+            metrics.registry.reset()
+            metrics.CACHE_REQUESTS.inc('test', 'hit')
+            metrics.registry.flush()
+            self.assertEqual(len(os.listdir(metrics_dir)), 2)
+            self.assertIn('cache_requests_total{cache="test",result="hit"} 6', metrics.registry.render())
+
+            out = StringIO()
+            call_command('clear_metrics', stdout=out)
+            self.assertEqual(out.getvalue().strip(), 'Deleted 2 metrics snapshots')
+            self.assertEqual(os.listdir(metrics_dir), [])
+
+    def test_metrics_need_a_staff_user_or_the_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.client.force_login(User.objects.create_user(username='jane'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+
+        with override_settings(METRICS_TOKEN='scrape-token'):
+            self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+            self.scrape(HTTP_AUTHORIZATION='Bearer scrape-token')
+
+
+class RenderingTests(APITestCase):
+    data = {
+        'id': uuid.UUID(int=1),
+        'title': 'Caf\u00e9 \u2028 line',
+        'price': Decimal('1.50'),
+        'label': gettext_lazy('Hello'),
+        'created_at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'tags': [1, 2],
+        1: None,
+    }
+
+    def test_output_matches_the_stdlib_renderer(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(renderers.FastJSONRenderer().render(self.data), expected)
+        self.assertEqual(
+            renderers.FastJSONRenderer().render(self.data, renderer_context={'indent': 4}),
+            JSONRenderer().render(self.data, renderer_context={'indent': 4}),
+        )
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(self.data), expected)
+
+    def test_parser(self):
+        body = b'{"title": "Caf\xc3\xa9", "tags": [1, 2]}'
+        parsed = renderers.FastJSONParser().parse(io.BytesIO(body))
+        self.assertEqual(parsed, JSONParser().parse(io.BytesIO(body)))
+        with self.assertRaises(ParseError):
+            renderers.FastJSONParser().parse(io.BytesIO(b'{"title": NaN}'))
+
+    def test_large_responses_are_gzipped(self):
+        Category.objects.bulk_create(
+            [Category(name=f'Category {i}', slug=f'category-{i}') for i in range(100)]
+        )
+        cache.clear()
+        url = reverse('blog:category-list') + '?limit=100'
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))['results']), 100)
+
+        self.assertFalse(self.client.get(url).has_header('Content-Encoding'))
+        # Below GZIP_MIN_SIZE
+        small = self.client.get(reverse('blog:category-list') + '?limit=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(small.has_header('Content-Encoding'))
+
+
+class DynamicFieldsLayoutCacheTests(APITestCase):
+
+    def test_layouts_are_reused_and_independent(self):
+        profile = Profile(bio='Hello', profile_picture='https://cdn.example.com/john.png')
+
+        bio_only = ProfileSerializer(profile, fields=['bio'])
+        self.assertEqual(bio_only.data, {'bio': 'Hello'})
+        self.assertEqual(ProfileSerializer(profile, exclude=['bio']).data, {'profile_picture_url': 'https://cdn.example.com/john.png'})
+
+        # Fields are copied per instance, never shared
+        self.assertIsNot(ProfileSerializer(profile, fields=['bio']).fields['bio'], bio_only.fields['bio'])
+
+    def test_unknown_field_names_do_not_grow_the_cache(self):
+        ProfileSerializer(fields=['bio']).fields
+        size = len(DynamicFieldsModelSerializer._field_layouts)
+        for i in range(10):
+            ProfileSerializer(fields=['bio', f'unknown{i}']).fields
+        self.assertEqual(len(DynamicFieldsModelSerializer._field_layouts), size)
+
+
+class ProfilePicturePipelineTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='john', password='secret-pass-123')
+        self.media_root = tempfile.TemporaryDirectory()
+        self.staging_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.addCleanup(self.staging_dir.cleanup)
+        settings = override_settings(
+            PROFILE_PICTURE_STORAGE='core.storage.LocalStorage',
+            MEDIA_ROOT=self.media_root.name,
+            PROFILE_PICTURE_STAGING_DIR=self.staging_dir.name,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def png(self, size=(600, 400)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'teal').save(buffer, 'PNG')
+        return SimpleUploadedFile('avatar.png', buffer.getvalue(), content_type='image/png')
+
+    def test_upload_is_staged_then_processed_by_the_worker(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(reverse('accounts:profile'), data={'profile_picture': self.png()})
+        self.assertEqual(response.status_code, 200)
+
+        upload = ProfilePictureUpload.objects.get()
+        self.assertEqual((upload.status, upload.content_type), (ProfilePictureUpload.PENDING, 'image/png'))
+        self.assertIsNone(Profile.objects.get(user=self.user).profile_picture)
+
+        call_command('process_profile_pictures', once=True, workers=1, stdout=StringIO())
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ProfilePictureUpload.DONE)
+        self.assertFalse(os.path.exists(upload.staged_path))
+
+        prefix = os.path.join(self.media_root.name, 'profile', str(upload.profile_id), str(upload.pk))
+        self.assertEqual(
+            sorted(os.listdir(prefix)),
+            ['128.png', '128.webp', '256.png', '256.webp', '64.png', '64.webp', 'original.png'],
+        )
+        with Image.open(os.path.join(prefix, '256.webp')) as thumbnail:
+            self.assertEqual(thumbnail.size, (256, 171))
+
+        key = f'profile/{upload.profile_id}/{upload.pk}/original.png'
+        self.assertEqual(Profile.objects.get(user=self.user).profile_picture, key)
+        response = self.client.get(reverse('accounts:profile'))
+        self.assertEqual(response.data['data']['profile']['profile_picture_url'], f'/media/{key}')
+
+    def test_oversized_uploads_are_refused_while_parsing(self):
+        self.client.force_authenticate(self.user)
+        with override_settings(PROFILE_PICTURE_MAX_SIZE=1000):
+            # Refused from the chunks read so far
+            response = self.client.post(reverse('accounts:profile'), data={'profile_picture': self.png()})
+            self.assertEqual(response.status_code, 413)
+
+            # Refused from the Content-Length alone
+            huge = SimpleUploadedFile('huge.png', b'\0' * (200 * 1024), content_type='image/png')
+            response = self.client.post(reverse('accounts:profile'), data={'profile_picture': huge})
+            self.assertEqual(response.status_code, 413)
+
+        self.assertFalse(ProfilePictureUpload.objects.exists())
+
+    def test_undecodable_picture_is_marked_failed(self):
+        staged = os.path.join(self.staging_dir.name, 'broken.png')
+        with open(staged, 'wb') as f:
+            f.write(b'not a png')
+        upload = ProfilePictureUpload.objects.create(
+            profile=self.user.profile, staged_path=staged, content_type='image/png'
+        )
+
+        call_command('process_profile_pictures', once=True, workers=1, stdout=StringIO())
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ProfilePictureUpload.FAILED)
+        self.assertIsNone(Profile.objects.get(user=self.user).profile_picture)
+        self.assertFalse(os.path.exists(staged))
+
+    def test_uploads_of_dead_workers_are_taken_back(self):
+        staged = os.path.join(self.staging_dir.name, 'avatar.png')
+        with open(staged, 'wb') as f:
+            f.write(self.png().read())
+        upload = ProfilePictureUpload.objects.create(
+            profile=self.user.profile, staged_path=staged, content_type='image/png',
+            status=ProfilePictureUpload.PROCESSING, claimed_at=timezone.now(), attempts=1,
+        )
+        # Still held by a live worker
+        self.assertEqual(claim_uploads(10), [])
+
+        ProfilePictureUpload.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        call_command('process_profile_pictures', once=True, workers=1, stdout=StringIO())
+        upload.refresh_from_db()
+        self.assertEqual((upload.status, upload.attempts), (ProfilePictureUpload.DONE, 2))
+        self.assertFalse(os.path.exists(staged))
+
+    def test_uploads_crashing_every_worker_are_given_up(self):
+        staged = os.path.join(self.staging_dir.name, 'avatar.png')
+        with open(staged, 'wb') as f:
+            f.write(self.png().read())
+        upload = ProfilePictureUpload.objects.create(
+            profile=self.user.profile, staged_path=staged, content_type='image/png',
+            status=ProfilePictureUpload.PROCESSING, claimed_at=timezone.now() - timedelta(hours=1), attempts=3,
+        )
+        self.assertEqual(claim_uploads(10), [])
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ProfilePictureUpload.FAILED)
+        self.assertFalse(os.path.exists(staged))
+
+
+    def test_broken_pool_leaves_its_uploads_to_a_retry(self):
+        uploads = []
+        for name in ('first.png', 'second.png'):
+            staged = os.path.join(self.staging_dir.name, name)
+            with open(staged, 'wb') as f:
+                f.write(self.png().read())
+            uploads.append(ProfilePictureUpload.objects.create(
+                profile=self.user.profile, staged_path=staged, content_type='image/png'
+            ))
+
+        # A process dying fails the render in flight, then every submit
+        crashed = Future()
+        crashed.set_exception(BrokenProcessPool('A process in the process pool was terminated abruptly'))
+        broken = mock.Mock(**{'submit.side_effect': [crashed, BrokenProcessPool('broken')]})
+        command = 'core.management.commands.process_profile_pictures.ProcessPoolExecutor'
+        with mock.patch(command, side_effect=[broken, mock.Mock()]) as pool:
+            stderr = StringIO()
+            call_command('process_profile_pictures', once=True, workers=1, stdout=StringIO(), stderr=stderr)
+        self.assertEqual(pool.call_count, 2)
+        self.assertIn('starting a new pool', stderr.getvalue())
+
+        for upload in uploads:
+            upload.refresh_from_db()
+            self.assertEqual((upload.status, upload.attempts), (ProfilePictureUpload.PROCESSING, 1))
+            self.assertTrue(os.path.exists(upload.staged_path))
+
+        ProfilePictureUpload.objects.update(claimed_at=timezone.now() - timedelta(hours=1))
+        call_command('process_profile_pictures', once=True, workers=1, stdout=StringIO())
+        self.assertEqual(
+            list(ProfilePictureUpload.objects.values_list('status', flat=True)),
+            [ProfilePictureUpload.DONE] * 2,
+        )
+
+class PresignedURLCacheTests(APITestCase):
+
+    def storage(self, **kwargs):
+        client = boto3.client(
+            's3', endpoint_url='https://r2.example.com', region_name='auto',
+            aws_access_key_id='key', aws_secret_access_key='secret',
+        )
+        return S3Storage(client=client, bucket='blog', **kwargs)
+
+    def test_urls_are_signed_once_per_key_and_window(self):
+        storage = self.storage()
+        with mock.patch.object(storage.client, 'generate_presigned_url', wraps=storage.client.generate_presigned_url) as sign:
+            urls = {storage.url('profile/1/original.png') for _ in range(50)}
+            storage.url('profile/2/original.png')
+            self.assertEqual(len(urls), 1)
+            self.assertEqual(sign.call_count, 2)
+
+            with override_settings(PROFILE_PICTURE_URL_REFRESH=1), mock.patch('core.storage.time.time', return_value=10 ** 10):
+                storage.url('profile/1/original.png')
+            self.assertEqual(sign.call_count, 3)
+
+        self.assertIn('X-Amz-Expires=604799', urls.pop())
+
+    def test_uploads_use_the_configured_multipart_transfer(self):
+        with override_settings(S3_MULTIPART_CHUNKSIZE=5 * 1024 * 1024):
+            storage = self.storage()
+        with mock.patch.object(storage.client, 'upload_fileobj') as upload:
+            storage.save('profile/1/original.png', io.BytesIO(b'png'), 'image/png')
+        config = upload.call_args.kwargs['Config']
+        self.assertEqual(config.multipart_chunksize, 5 * 1024 * 1024)
+        self.assertEqual(upload.call_args.kwargs['ExtraArgs'], {'ContentType': 'image/png'})
+
+    def test_public_url_mode_skips_signing(self):
+        storage = self.storage(public_url='https://cdn.example.com/')
+        with mock.patch.object(storage.client, 'generate_presigned_url') as sign:
+            self.assertEqual(storage.url('profile/1/original.png'), 'https://cdn.example.com/profile/1/original.png')
+        sign.assert_not_called()
+
+        # The path of the public URL is kept, with or without a trailing slash
+        storage = self.storage(public_url='https://example.com/pictures')
+        self.assertEqual(storage.url('profile/1/original.png'), 'https://example.com/pictures/profile/1/original.png')
+
+    def test_storages_are_not_kept_alive_by_the_url_cache(self):
+        storage = self.storage()
+        storage.url('profile/1/original.png')
+        ref = weakref.ref(storage)
+        del storage
+        gc.collect()
+        self.assertIsNone(ref())
+
+    @override_settings(PROFILE_PICTURE_STORAGE='core.storage.LocalStorage', MEDIA_URL='/media/')
+    def test_expired_presigned_urls_are_served_from_their_key(self):
+        legacy = (
+            'https://account.r2.cloudflarestorage.com/blog/profile/john_doe_profile.png'
+            '?X-Amz-Algorithm=AWS4-HMAC-SHA256&X-Amz-Expires=604799&X-Amz-Signature=abc123'
+        )
+        with mock.patch('core.storage.R2_BUCKET_NAME', 'blog'):
+            self.assertEqual(picture_url(legacy), '/media/profile/john_doe_profile.png')
+        # Plain links are left alone
+        self.assertEqual(picture_url('https://cdn.example.com/john.png'), 'https://cdn.example.com/john.png')
+
+
+class EmailOutboxTests(APITestCase):
+
+    def setUp(self):
+        for i in range(3):
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', first_name=f'Name{i}')
+
+    def request_reset(self, email):
+        response = self.client.post(reverse('accounts:password_reset'), data={'email': email})
+        self.assertEqual(response.status_code, 200)
+
+    def test_reset_emails_are_queued_then_sent_in_one_batch(self):
+        for i in range(3):
+            self.request_reset(f'user{i}@example.com')
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.PENDING).count(), 3)
+
+        with mock.patch('core.outbox.get_connection', wraps=mail.get_connection) as get_connection:
+            call_command('send_outbox_emails', once=True, stdout=StringIO())
+        get_connection.assert_called_once()
+
+        self.assertEqual(len(mail.outbox), 3)
+        message = mail.outbox[0]
+        self.assertEqual(message.to, ['user0@example.com'])
+        self.assertIn('Hi Name0', message.alternatives[0][0])
+        self.assertIn('/password_reset_confirm/', message.alternatives[0][0])
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 3)
+
+    def test_failures_are_retried_with_backoff(self):
+        self.request_reset('user0@example.com')
+        with override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2), \
+                mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('down')):
+            call_command('send_outbox_emails', once=True, stdout=StringIO())
+            email = OutboxEmail.objects.get()
+            self.assertEqual((email.status, email.attempts, email.last_error), (OutboxEmail.PENDING, 1, 'down'))
+            self.assertGreater(email.next_attempt_at, email.created_at)
+
+            # Not due yet, nothing happens
+            call_command('send_outbox_emails', once=True, stdout=StringIO())
+            self.assertEqual(OutboxEmail.objects.get().attempts, 1)
+
+            OutboxEmail.objects.update(next_attempt_at=email.created_at)
+            call_command('send_outbox_emails', once=True, stdout=StringIO())
+            self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.FAILED)
+
+    def test_unreachable_mail_server_reschedules_the_batch(self):
+        for i in range(2):
+            self.request_reset(f'user{i}@example.com')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=ConnectionRefusedError('refused')):
+            call_command('send_outbox_emails', once=True, stdout=StringIO())
+
+        emails = OutboxEmail.objects.all()
+        self.assertEqual(
+            {(email.status, email.attempts, email.last_error) for email in emails},
+            {(OutboxEmail.PENDING, 1, 'refused')},
+        )
+        self.assertTrue(all(email.next_attempt_at > email.created_at for email in emails))
+
+    def test_emails_are_claimed_before_sending(self):
+        self.request_reset('user0@example.com')
+
+        seen = []
+
+        def send(message):
+            seen.append(OutboxEmail.objects.values_list('attempts', 'next_attempt_at').get())
+            return 1
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', autospec=True, side_effect=send):
+            call_command('send_outbox_emails', once=True, stdout=StringIO())
+        self.assertEqual(OutboxEmail.objects.get().status, OutboxEmail.SENT)
+
+        # Already claimed while sending, so other workers skip it without a lock
+        [(attempts, next_attempt_at)] = seen
+        self.assertEqual(attempts, 1)
+        self.assertGreater(next_attempt_at, timezone.now())
+
+    def test_emails_of_a_dead_worker_are_claimed_again(self):
+        self.request_reset('user0@example.com')
+        claim_batch(10)
+        self.assertEqual(claim_batch(10), [])
+
+        OutboxEmail.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([email.attempts for email in claim_batch(10)], [2])
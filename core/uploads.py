@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+# Room for multipart boundaries and the non-file form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class FileTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded file is too large.'
+    default_code = 'file_too_large'
+
+
+class MaxSizeUploadHandler(FileUploadHandler):
+    """Stop reading an upload as soon as it goes over ``max_size`` bytes
+
+    Put in front of the default handlers, so an oversized request is refused
+    from its Content-Length before any of it is read, and a request without
+    one is cut off at the first chunk past the limit instead of being
+    spooled to memory or disk in full.
+    """
+
+    def __init__(self, request=None, max_size=None):
+        super().__init__(request)
+        self.max_size = max_size or settings.PROFILE_PICTURE_MAX_SIZE
+
+    def too_large(self):
+        return FileTooLarge(f'Uploaded file is larger than {self.max_size} bytes.')
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.max_size + MULTIPART_OVERHEAD:
+            raise self.too_large()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            raise self.too_large()
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -1,8 +1,13 @@
+import hmac
+
 from django.conf import settings
+from django.http import HttpResponse
 from django.urls import reverse
 from django.views import View
 from django.shortcuts import render
 
+from . import metrics
+
 class PasswordResetConfirmPageView(View):
     def get(self, request, uidb64, token):
         confirm_url = reverse('accounts:password_reset_confirm')
@@ -13,3 +18,18 @@ class PasswordResetConfirmPageView(View):
             'confirm_full_url': confirm_full_url
         }
         return render(request, 'password_reset_confirm.html', context)
+
+
+class MetricsView(View):
+    """ Metrics in the Prometheus text format, for METRICS_TOKEN as a Bearer token or staff users """
+
+    def get(self, request):
+        if not (self.has_token(request) or request.user.is_staff):
+            return HttpResponse(status=401)
+        return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    def has_token(self, request):
+        if not settings.METRICS_TOKEN:
+            return False
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        return hmac.compare_digest(request.headers.get('Authorization', ''), expected)